@@ -0,0 +1,182 @@
+"""
+Contrôle d'admission des requêtes de restauration.
+
+Chaque requête est facturée par son nombre de pixels décodés (connu dès
+la lecture de l'en-tête de l'image) sur un budget global de pixels en
+cours de traitement. Deux voies :
+
+- voie rapide (``fast``) : petites images, prioritaires, avec une part
+  du budget qui leur est réservée ;
+- voie débit (``throughput``) : grandes images, traitées par tuiles pour
+  borner la mémoire, sans jamais passer devant une petite image en attente.
+
+Une requête dont l'attente estimée en file dépasse l'échéance est rejetée
+tout de suite (503 + Retry-After) plutôt que de retarder les autres ; son
+propre temps de traitement n'entre pas dans l'estimation.
+"""
+
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import metrics
+
+
+FAST_LANE = "fast"
+THROUGHPUT_LANE = "throughput"
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée par le contrôleur d'admission."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _Lane:
+    """État d'une voie : créneaux, pixels en attente et débit observé."""
+
+    def __init__(self, name: str, slots: int, pixel_limit: int):
+        self.name = name
+        self.slots = slots
+        self.pixel_limit = pixel_limit
+        self.running = 0
+        self.waiting = 0
+        self.pending_pixels = 0  # Pixels en attente + en cours dans la voie
+        self.seconds_per_pixel = None  # Moyenne glissante, None tant qu'aucune mesure
+
+    def estimate_wait(self) -> float:
+        """
+        Attente estimée d'une requête entrant maintenant dans la voie : temps
+        de traitement des pixels déjà en attente ou en cours. Le traitement de
+        la requête elle-même n'est pas compté : une voie vide admet toujours,
+        ce qui garde la moyenne glissante à jour après une requête lente.
+        """
+        if self.seconds_per_pixel is None or self.pending_pixels == 0:
+            return 0.0
+        return self.pending_pixels * self.seconds_per_pixel / self.slots
+
+    def observe(self, pixels: int, seconds: float, alpha: float = 0.2):
+        rate = seconds / max(pixels, 1)
+        if self.seconds_per_pixel is None:
+            self.seconds_per_pixel = rate
+        else:
+            self.seconds_per_pixel = alpha * rate + (1 - alpha) * self.seconds_per_pixel
+
+
+class AdmissionController:
+    """
+    Budget global de pixels en vol, voies rapide/débit et rejet anticipé.
+
+    Args:
+        pixel_budget: Pixels décodés simultanément au maximum (toutes voies)
+        small_image_pixels: Seuil (en pixels) de la voie rapide
+        fast_slots: Inférences simultanées dans la voie rapide
+        throughput_slots: Inférences simultanées dans la voie débit
+        fast_reserved_pixels: Part du budget inaccessible à la voie débit
+        deadline_seconds: Attente maximale en file (estimée à l'arrivée, puis
+            effective) au-delà de laquelle une requête est rejetée
+    """
+
+    def __init__(self, pixel_budget: int, small_image_pixels: int, fast_slots: int = 1,
+                 throughput_slots: int = 1, fast_reserved_pixels: int = 0,
+                 deadline_seconds: float = 30.0):
+        self.pixel_budget = pixel_budget
+        self.small_image_pixels = small_image_pixels
+        self.deadline_seconds = deadline_seconds
+        self.pixels_in_flight = 0
+        self._lanes = {
+            FAST_LANE: _Lane(FAST_LANE, fast_slots, pixel_budget),
+            THROUGHPUT_LANE: _Lane(THROUGHPUT_LANE, throughput_slots, pixel_budget - fast_reserved_pixels),
+        }
+        self._condition = asyncio.Condition()
+
+    def lane_for(self, pixels: int) -> str:
+        return FAST_LANE if pixels <= self.small_image_pixels else THROUGHPUT_LANE
+
+    def _can_start(self, lane: _Lane, pixels: int) -> bool:
+        if lane.running >= lane.slots:
+            return False
+        # Priorité stricte : la voie débit laisse passer les petites images en attente
+        if lane.name == THROUGHPUT_LANE and self._lanes[FAST_LANE].waiting > 0:
+            return False
+        return self.pixels_in_flight + pixels <= lane.pixel_limit
+
+    def _reject(self, lane: _Lane, status_code: int, reason: str, detail: str,
+                retry_after: Optional[int] = None):
+        metrics.ADMISSIONS_TOTAL.labels(lane=lane.name, outcome=reason).inc()
+        raise AdmissionRejected(status_code, detail, retry_after)
+
+    @asynccontextmanager
+    async def admit(self, pixels: int):
+        """
+        Attend qu'une requête de ``pixels`` puisse être traitée et réserve
+        sa part du budget jusqu'à la sortie du contexte.
+
+        Yields:
+            Nom de la voie attribuée (``fast`` ou ``throughput``)
+
+        Raises:
+            AdmissionRejected: 413 si l'image dépasse seule le budget,
+                503 si l'échéance ne peut pas être tenue
+        """
+        lane = self._lanes[self.lane_for(pixels)]
+
+        if pixels > lane.pixel_limit:
+            self._reject(lane, 413, "too_large",
+                         f"Image trop grande : {pixels:,} pixels (maximum {lane.pixel_limit:,})")
+
+        estimate = lane.estimate_wait()
+        if estimate > self.deadline_seconds:
+            self._reject(lane, 503, "shed",
+                         f"Serveur saturé : attente estimée {estimate:.0f}s "
+                         f"(échéance {self.deadline_seconds:.0f}s)",
+                         retry_after=max(1, math.ceil(estimate - self.deadline_seconds)))
+
+        lane.pending_pixels += pixels
+        metrics.QUEUE_DEPTH.inc()
+        queued = True
+        started = False
+        try:
+            async with self._condition:
+                lane.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._can_start(lane, pixels)),
+                        timeout=self.deadline_seconds
+                    )
+                except asyncio.TimeoutError:
+                    self._reject(lane, 503, "shed",
+                                 f"Serveur saturé : échéance de {self.deadline_seconds:.0f}s dépassée en file d'attente",
+                                 retry_after=math.ceil(self.deadline_seconds))
+                finally:
+                    lane.waiting -= 1
+                    # Une voie débit bloquée par la priorité peut repartir
+                    self._condition.notify_all()
+                lane.running += 1
+                self.pixels_in_flight += pixels
+                started = True
+
+            metrics.QUEUE_DEPTH.dec()
+            queued = False
+            metrics.ADMISSIONS_TOTAL.labels(lane=lane.name, outcome="admitted").inc()
+            metrics.PIXELS_IN_FLIGHT.set(self.pixels_in_flight)
+
+            start = time.perf_counter()
+            yield lane.name
+            lane.observe(pixels, time.perf_counter() - start)
+        finally:
+            if queued:
+                metrics.QUEUE_DEPTH.dec()
+            lane.pending_pixels -= pixels
+            if started:
+                async with self._condition:
+                    lane.running -= 1
+                    self.pixels_in_flight -= pixels
+                    metrics.PIXELS_IN_FLIGHT.set(self.pixels_in_flight)
+                    self._condition.notify_all()
@@ -0,0 +1,192 @@
+"""
+Outils pour l'endpoint /restore-batch : regroupement des images par taille
+pour les forwards batchés, et encodage progressif de la réponse (ZIP ou
+multipart) au fur et à mesure que les images sont restaurées.
+"""
+
+import io
+import json
+import uuid
+import zipfile
+from pathlib import PurePosixPath
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from inference import padded_size, BucketPolicy
+
+
+EXIF_ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}  # Rotations de 90° / 270°
+UNSAFE_FILENAME_CHARS = {'"', "'", "\\", "/"}
+
+
+def safe_filename(filename: Optional[str], index: int) -> str:
+    """
+    Nom de fichier fourni par le client, réduit à un nom de base sûr pour
+    les entrées ZIP et les en-têtes Content-Disposition (pas de chemin,
+    de ``..``, de guillemets ni de caractères de contrôle).
+
+    Args:
+        filename: Nom envoyé par le client (peut être vide ou None)
+        index: Position du fichier, pour le nom de repli ``image_{index}``
+
+    Returns:
+        Nom sûr, ou ``image_{index}`` s'il ne reste rien
+    """
+    name = PurePosixPath((filename or "").replace("\\", "/")).name
+    name = "".join(c for c in name if c.isprintable() and c not in UNSAFE_FILENAME_CHARS)
+    while ".." in name:
+        name = name.replace("..", ".")
+    name = name.strip(". ")
+    return name or f"image_{index}"
+
+
+@dataclass
+class BatchItem:
+    """Un fichier de la requête batch."""
+    index: int
+    filename: str
+    image: Optional[Image.Image] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+    @property
+    def stem(self) -> str:
+        return self.filename.rsplit('.', 1)[0]
+
+    @property
+    def pixels(self) -> int:
+        return self.image.width * self.image.height if self.image is not None else 0
+
+
+@dataclass
+class BatchGroup:
+    """Images restaurées ensemble (même taille paddée, un seul forward)."""
+    items: List[BatchItem] = field(default_factory=list)
+
+    @property
+    def pixels(self) -> int:
+        return sum(item.pixels for item in self.items)
+
+
+def oriented_size(image: Image.Image) -> Tuple[int, int]:
+    """
+    Taille (W, H) de l'image après correction EXIF, lue sans décoder les pixels.
+    """
+    try:
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        orientation = 1
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        return image.height, image.width
+    return image.width, image.height
+
+
+def plan_batches(items: Iterable[BatchItem], max_batch_size: int, max_batch_pixels: int,
+                 bucket_policy: Optional[BucketPolicy] = None) -> List[BatchGroup]:
+    """
+    Regroupe les images valides par taille paddée (bucket si ``bucket_policy``
+    est fourni), en lots d'au plus ``max_batch_size`` images et
+    ``max_batch_pixels`` pixels.
+
+    Une image plus grande que ``max_batch_pixels`` forme un lot à elle seule.
+    Les lots sont ordonnés du plus petit au plus grand pour que les
+    premiers résultats arrivent vite.
+    """
+    by_shape: Dict[Tuple[int, int], List[BatchItem]] = {}
+    for item in items:
+        if item.image is None:
+            continue
+        key = padded_size(*oriented_size(item.image), bucket_policy=bucket_policy)
+        by_shape.setdefault(key, []).append(item)
+
+    groups = []
+    for key in sorted(by_shape, key=lambda k: k[0] * k[1]):
+        group = BatchGroup()
+        for item in by_shape[key]:
+            if group.items and (len(group.items) >= max_batch_size
+                                or group.pixels + item.pixels > max_batch_pixels):
+                groups.append(group)
+                group = BatchGroup()
+            group.items.append(item)
+        groups.append(group)
+    return groups
+
+
+def error_payload(item: BatchItem) -> bytes:
+    """Contenu JSON du fichier ``.error.json`` d'une image en échec."""
+    return json.dumps({
+        "index": item.index,
+        "filename": item.filename,
+        "status_code": item.status_code,
+        "error": item.error,
+    }, ensure_ascii=False).encode("utf-8")
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """
+    Flux en écriture seule et non-seekable : zipfile écrit alors des
+    descripteurs de données et peut être vidé au fil de l'eau.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStreamWriter:
+    """Archive ZIP produite entrée par entrée (images PNG, erreurs JSON)."""
+
+    media_type = "application/zip"
+
+    def __init__(self):
+        self._buffer = _ChunkBuffer()
+        # Les PNG sont déjà compressés : stockage sans recompression
+        self._zip = zipfile.ZipFile(self._buffer, mode="w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes, content_type: str) -> bytes:
+        self._zip.writestr(name, data)
+        return self._buffer.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._buffer.drain()
+
+
+class MultipartStreamWriter:
+    """Réponse multipart/mixed produite partie par partie."""
+
+    def __init__(self):
+        self.boundary = uuid.uuid4().hex
+        self.media_type = f"multipart/mixed; boundary={self.boundary}"
+
+    def add(self, name: str, data: bytes, content_type: str) -> bytes:
+        headers = (
+            f"--{self.boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Disposition: attachment; filename=\"{name}\"\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n"
+        )
+        return headers.encode("utf-8") + data + b"\r\n"
+
+    def close(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("utf-8")
+
+
+STREAM_WRITERS = {
+    "zip": ZipStreamWriter,
+    "multipart": MultipartStreamWriter,
+}
@@ -0,0 +1,245 @@
+"""
+Benchmarks hors ligne du modèle.
+
+Commandes :
+    pruning : latence, taille et PSNR pour plusieurs taux d'élagage
+    buckets : réutilisation des formes vs calcul perdu selon la granularité des buckets
+
+Usage :
+    python benchmark.py pruning --model models/best_model.pth --ratios 0 0.25 0.5 0.75 --calibrate 20
+    python benchmark.py pruning --random --json results/pruning.json
+    python benchmark.py buckets --steps 1.1 1.25 1.5 2.0 --measure 40 --random
+"""
+
+import json
+import time
+import argparse
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from model import UNet, load_model
+from inference import BucketPolicy, geometric_bucket_sizes, pad_to_bucket, pad_to_multiple_of_16
+from prune import (prune_model, count_parameters, checkpoint_size, synthetic_batch,
+                   evaluate_psnr, calibrate_batchnorm, finetune, CRITERIA)
+
+
+@torch.no_grad()
+def measure_latency(model: torch.nn.Module, device: torch.device, height: int, width: int,
+                    repeats: int = 5, warmup: int = 1) -> float:
+    """Latence médiane (ms) d'un forward sur une entrée (1, 4, H, W)."""
+    model.eval()
+    x = torch.randn(1, model.n_channels, height, width, device=device)
+    timings = []
+    for i in range(warmup + repeats):
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        model(x)
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def print_table(rows: List[Dict], columns: List[tuple]):
+    """Affiche une liste de dictionnaires en tableau (colonnes : (clé, titre, format))."""
+    cells = [[fmt.format(row[key]) for key, _, fmt in columns] for row in rows]
+    widths = [max(len(title), *(len(r[i]) for r in cells)) for i, (_, title, _) in enumerate(columns)]
+    print("  ".join(title.rjust(w) for (_, title, _), w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for r in cells:
+        print("  ".join(c.rjust(w) for c, w in zip(r, widths)))
+
+
+def run_pruning(args, device: torch.device) -> List[Dict]:
+    if args.random:
+        torch.manual_seed(args.seed)
+        base = UNet().to(device).eval()
+        print("⚠️  Modèle aléatoire : les PSNR ne sont pas significatifs")
+    else:
+        base = load_model(args.model, device)
+
+    rng = np.random.default_rng(args.seed)
+    eval_batches = [synthetic_batch(args.batch_size, args.eval_size, rng) for _ in range(args.eval_batches)]
+
+    rows = []
+    for ratio in args.ratios:
+        model = base if ratio == 0 else prune_model(base, ratio, args.criterion)
+        if ratio > 0 and args.calibrate > 0:
+            calibrate_batchnorm(model, args.calibrate, device, seed=args.seed + 1)
+        if ratio > 0 and args.finetune_steps > 0:
+            finetune(model, args.finetune_steps, device, seed=args.seed + 2)
+        psnr_in, psnr_out = evaluate_psnr(model, eval_batches, device)
+        rows.append({
+            "ratio": ratio,
+            "params": count_parameters(model),
+            "size_mb": checkpoint_size(model) / 1e6,
+            "latency_ms": measure_latency(model, device, args.height, args.width, repeats=args.repeats),
+            "psnr_input": psnr_in,
+            "psnr_restored": psnr_out,
+            "psnr_gain": psnr_out - psnr_in,
+        })
+        print(f"✂️  ratio {ratio:.2f} terminé")
+
+    print(f"\n📊 Élagage ({args.criterion}) - latence {args.width}x{args.height} sur {device}\n")
+    print_table(rows, [
+        ("ratio", "ratio", "{:.2f}"),
+        ("params", "paramètres", "{:,}"),
+        ("size_mb", "taille (MB)", "{:.1f}"),
+        ("latency_ms", "latence (ms)", "{:.1f}"),
+        ("psnr_input", "PSNR JPEG", "{:.2f}"),
+        ("psnr_restored", "PSNR restauré", "{:.2f}"),
+        ("psnr_gain", "gain (dB)", "{:+.2f}"),
+    ])
+    return rows
+
+
+def sample_image_sizes(count: int, min_side: int, max_side: int, seed: int) -> List[tuple]:
+    """Tailles (H, W) aléatoires, log-uniformes : beaucoup de petites images, quelques grandes."""
+    rng = np.random.default_rng(seed)
+    sides = np.exp(rng.uniform(np.log(min_side), np.log(max_side), (count, 2))).astype(int)
+    return [(int(h), int(w)) for h, w in sides]
+
+
+@torch.no_grad()
+def replay_shapes(model: torch.nn.Module, device: torch.device, sizes: List[tuple],
+                  policy: BucketPolicy = None) -> Dict:
+    """
+    Rejoue une suite de tailles d'images à travers le modèle et sépare le
+    coût des formes vues pour la première fois (plans à calculer) de celui
+    des formes déjà vues.
+    """
+    seen, cold, warm = set(), [], []
+    image_pixels = 0
+    total = 0.0
+    for h, w in sizes:
+        x = torch.zeros((1, model.n_channels, h, w), device=device)
+        padded, _ = pad_to_bucket(x, policy) if policy is not None else pad_to_multiple_of_16(x)
+        shape = tuple(padded.shape[2:])
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        model(padded)
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        elapsed = (time.perf_counter() - start) * 1000
+        (warm if shape in seen else cold).append(elapsed)
+        seen.add(shape)
+        image_pixels += h * w
+        total += elapsed
+    return {
+        "cold_ms": float(np.mean(cold)) if cold else 0.0,
+        "warm_ms": float(np.mean(warm)) if warm else 0.0,
+        "ms_per_mpx": total / (image_pixels / 1e6),
+    }
+
+
+def run_buckets(args, device: torch.device) -> List[Dict]:
+    sizes = sample_image_sizes(args.requests, args.min_side, args.max_side, args.seed)
+    configs = [("exact (x16)", None)] + [
+        (f"step {step:g}", step) for step in args.steps
+    ]
+
+    model = None
+    if args.measure > 0:
+        if args.random:
+            torch.manual_seed(args.seed)
+            model = UNet().to(device).eval()
+        else:
+            model = load_model(args.model, device)
+
+    rows = []
+    for label, step in configs:
+        policy = None
+        if step is not None:
+            policy = BucketPolicy(
+                sizes=geometric_bucket_sizes(min_size=64, max_size=args.max_side, step=step),
+                max_extra_pixels=args.max_extra_pixels,
+            )
+        # Statistiques analytiques sur toutes les requêtes (formes exactes comprises)
+        targets = [policy.target_size(h, w) if policy is not None else ((h + 15) // 16 * 16, (w + 15) // 16 * 16)
+                   for h, w in sizes]
+        image_pixels = sum(h * w for h, w in sizes)
+        padded_pixels = sum(h * w for h, w in targets)
+        row = {
+            "config": label,
+            "buckets": len(policy.sizes) if policy is not None else 0,
+            "distinct_shapes": len(set(targets)),
+            "reuse_ratio": 1 - len(set(targets)) / len(targets),
+            "waste_ratio": 1 - image_pixels / padded_pixels,
+        }
+        if model is not None:
+            row.update(replay_shapes(model, device, sizes[:args.measure], policy))
+        rows.append(row)
+
+    print(f"\n📊 Bucketing - {args.requests} tailles log-uniformes entre {args.min_side} et {args.max_side} px\n")
+    columns = [
+        ("config", "config", "{}"),
+        ("buckets", "buckets", "{}"),
+        ("distinct_shapes", "formes", "{}"),
+        ("reuse_ratio", "réutilisation", "{:.1%}"),
+        ("waste_ratio", "calcul perdu", "{:.1%}"),
+    ]
+    if model is not None:
+        columns += [
+            ("cold_ms", "1re forme (ms)", "{:.1f}"),
+            ("warm_ms", "forme connue (ms)", "{:.1f}"),
+            ("ms_per_mpx", "ms/MP", "{:.1f}"),
+        ]
+    print_table(rows, columns)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne du modèle UnblurAI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pruning = subparsers.add_parser("pruning", help="Latence/taille vs PSNR selon le taux d'élagage")
+    pruning.add_argument("--model", default="models/best_model.pth", help="Checkpoint d'origine")
+    pruning.add_argument("--random", action="store_true", help="Utiliser un modèle aléatoire (sans checkpoint)")
+    pruning.add_argument("--ratios", type=float, nargs="+", default=[0.0, 0.25, 0.5, 0.75])
+    pruning.add_argument("--criterion", choices=CRITERIA, default="bn")
+    pruning.add_argument("--calibrate", type=int, default=0, help="Étapes de recalibration BatchNorm")
+    pruning.add_argument("--finetune-steps", type=int, default=0, help="Étapes de fine-tuning synthétique")
+    pruning.add_argument("--width", type=int, default=512, help="Largeur de l'entrée pour la latence")
+    pruning.add_argument("--height", type=int, default=512, help="Hauteur de l'entrée pour la latence")
+    pruning.add_argument("--repeats", type=int, default=5)
+    pruning.add_argument("--eval-batches", type=int, default=4)
+    pruning.add_argument("--eval-size", type=int, default=128)
+    pruning.add_argument("--batch-size", type=int, default=4)
+    pruning.add_argument("--seed", type=int, default=0)
+    pruning.add_argument("--json", help="Écrire les résultats dans ce fichier JSON")
+
+    buckets = subparsers.add_parser("buckets", help="Réutilisation des formes vs calcul perdu selon les buckets")
+    buckets.add_argument("--steps", type=float, nargs="+", default=[1.1, 1.25, 1.5, 2.0],
+                         help="Raisons géométriques des tailles de buckets")
+    buckets.add_argument("--max-extra-pixels", type=int, default=256 * 256)
+    buckets.add_argument("--requests", type=int, default=1000, help="Nombre de tailles simulées")
+    buckets.add_argument("--min-side", type=int, default=64)
+    buckets.add_argument("--max-side", type=int, default=2048)
+    buckets.add_argument("--measure", type=int, default=0,
+                         help="Rejouer les N premières tailles à travers le modèle (0 = analyse seule)")
+    buckets.add_argument("--model", default="models/best_model.pth", help="Checkpoint pour --measure")
+    buckets.add_argument("--random", action="store_true", help="Modèle aléatoire pour --measure")
+    buckets.add_argument("--seed", type=int, default=0)
+    buckets.add_argument("--json", help="Écrire les résultats dans ce fichier JSON")
+
+    args = parser.parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    if args.command == "pruning":
+        rows = run_pruning(args, device)
+    elif args.command == "buckets":
+        rows = run_buckets(args, device)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"command": args.command, "device": str(device), "results": rows}, f, indent=2)
+        print(f"\n💾 Résultats écrits dans {args.json}")
+
+
+if __name__ == "__main__":
+    main()
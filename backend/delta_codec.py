@@ -0,0 +1,158 @@
+"""
+Encodage compact du delta résiduel (réponse ``response_format=delta``).
+
+Le client possède déjà l'image d'origine : au lieu de renvoyer le PNG
+restauré complet, on renvoie ``restauré - original`` quantifié en int8,
+découpé en tuiles (les tuiles nulles sont omises), puis compressé avec
+deflate (zlib), qui absorbe les longues plages de zéros.
+
+Format (little-endian) :
+    En-tête (21 octets, non compressé)
+        magic        4 octets  b"UBD1"
+        version      u8        1
+        channels     u8        3 (RGB)
+        step         u8        pas de quantification
+        tile_size    u16
+        width        u32
+        height       u32
+        tiles        u32       nombre de tuiles non vides
+    Corps (zlib)
+        pour chaque tuile non vide :
+            index    u32       rang de la tuile (ligne par ligne)
+            data     int8[h * w * 3]  delta / step, ordre HWC
+
+Reconstruction : restauré = clip(original + data * step, 0, 255).
+Le décodeur de référence est decode_delta / apply_delta ; le décodeur
+navigateur est frontend/src/utils/deltaDecoder.js.
+
+Usage :
+    python delta_codec.py apply image.jpg restored.ubd restored.png
+"""
+
+import sys
+import zlib
+import struct
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+MAGIC = b"UBD1"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBHIII")
+TILE_INDEX = struct.Struct("<I")
+MEDIA_TYPE = "application/x-unblurai-delta"
+
+
+def _tile_grid(width: int, height: int, tile_size: int) -> Tuple[int, int]:
+    return (height + tile_size - 1) // tile_size, (width + tile_size - 1) // tile_size
+
+
+def encode_delta(original: np.ndarray, restored: np.ndarray, step: int = 1,
+                 tile_size: int = 64, level: int = 6) -> Tuple[bytes, Dict]:
+    """
+    Encode ``restored - original`` (tableaux uint8 HxWx3).
+
+    Args:
+        original: Image d'entrée telle que le client la décode
+        restored: Image restaurée
+        step: Pas de quantification (1 = sans perte si |delta| <= 127)
+        tile_size: Taille des tuiles
+        level: Niveau de compression zlib
+
+    Returns:
+        Tuple (payload, statistiques : tuiles non vides / total, taille)
+    """
+    if original.shape != restored.shape or original.ndim != 3 or original.shape[2] != 3:
+        raise ValueError("original et restored doivent être des tableaux HxWx3 de même taille")
+    if not 1 <= step <= 255:
+        raise ValueError("step doit être dans [1, 255]")
+
+    height, width = original.shape[:2]
+    delta = restored.astype(np.int16) - original.astype(np.int16)
+    quantized = np.clip(np.round(delta / step), -127, 127).astype(np.int8)
+
+    rows, cols = _tile_grid(width, height, tile_size)
+    body = []
+    tiles = 0
+    for row in range(rows):
+        for col in range(cols):
+            tile = quantized[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+            if not tile.any():
+                continue
+            body.append(TILE_INDEX.pack(row * cols + col))
+            body.append(np.ascontiguousarray(tile).tobytes())
+            tiles += 1
+
+    header = HEADER.pack(MAGIC, VERSION, 3, step, tile_size, width, height, tiles)
+    payload = header + zlib.compress(b"".join(body), level)
+    return payload, {"tiles": tiles, "tiles_total": rows * cols, "bytes": len(payload)}
+
+
+def decode_delta(payload: bytes) -> np.ndarray:
+    """
+    Décodeur de référence : retourne le delta déquantifié (int16, HxWx3).
+
+    Raises:
+        ValueError: Payload invalide, tronqué ou corrompu
+    """
+    if len(payload) < HEADER.size:
+        raise ValueError("Payload delta tronqué")
+    magic, version, channels, step, tile_size, width, height, tiles = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION or channels != 3:
+        raise ValueError("Payload delta invalide (magic/version)")
+
+    if tile_size == 0:
+        raise ValueError("Payload delta invalide (tile_size nul)")
+    try:
+        body = zlib.decompress(payload[HEADER.size:])
+    except zlib.error as e:
+        raise ValueError(f"Payload delta tronqué ou corrompu : {e}") from e
+
+    delta = np.zeros((height, width, 3), dtype=np.int16)
+    rows, cols = _tile_grid(width, height, tile_size)
+    offset = 0
+    for _ in range(tiles):
+        if offset + TILE_INDEX.size > len(body):
+            raise ValueError("Payload delta tronqué")
+        (index,) = TILE_INDEX.unpack_from(body, offset)
+        offset += TILE_INDEX.size
+        row, col = divmod(index, cols)
+        if row >= rows:
+            raise ValueError("Index de tuile hors de l'image")
+        top, left = row * tile_size, col * tile_size
+        tile_h, tile_w = min(tile_size, height - top), min(tile_size, width - left)
+        size = tile_h * tile_w * 3
+        if offset + size > len(body):
+            raise ValueError("Payload delta tronqué")
+        tile = np.frombuffer(body, dtype=np.int8, count=size, offset=offset)
+        delta[top:top + tile_h, left:left + tile_w] = tile.reshape(tile_h, tile_w, 3).astype(np.int16) * step
+        offset += size
+    return delta
+
+
+def apply_delta(original: np.ndarray, payload: bytes) -> np.ndarray:
+    """Reconstruit l'image restaurée (uint8 HxWx3) à partir de l'original et du payload."""
+    delta = decode_delta(payload)
+    if delta.shape != original.shape:
+        raise ValueError(f"Taille de l'original {original.shape} différente du delta {delta.shape}")
+    return np.clip(original.astype(np.int16) + delta, 0, 255).astype(np.uint8)
+
+
+def main():
+    if len(sys.argv) != 5 or sys.argv[1] != "apply":
+        print("Usage : python delta_codec.py apply <original> <delta.ubd> <sortie.png>")
+        sys.exit(1)
+
+    from inference import correct_image_orientation
+
+    original = correct_image_orientation(Image.open(sys.argv[2])).convert("RGB")
+    with open(sys.argv[3], "rb") as f:
+        restored = apply_delta(np.asarray(original), f.read())
+    Image.fromarray(restored, mode="RGB").save(sys.argv[4])
+    print(f"✅ Image reconstruite : {sys.argv[4]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,20 @@ Fonctions de prétraitement, inférence et post-traitement pour la restauration
 Ces fonctions reproduisent exactement le pipeline utilisé lors de l'entraînement.
 """
 
+import threading
 import torch
 import numpy as np
 from PIL import Image
-from typing import Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from contextlib import nullcontext
 import torch.nn.functional as F
 
 
+def _stage(timer, name: str):
+    """Contexte de mesure d'une étape (no-op si aucun timer n'est fourni)."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
 def correct_image_orientation(image: Image.Image) -> Image.Image:
     """
     Corrige l'orientation de l'image en fonction des métadonnées EXIF.
@@ -113,6 +120,154 @@ def pad_to_multiple_of_16(tensor: torch.Tensor) -> Tuple[torch.Tensor, Tuple[int
     return tensor, (pad_left, pad_right, pad_top, pad_bottom)
 
 
+def geometric_bucket_sizes(min_size: int = 64, max_size: int = 4096, step: float = 1.25,
+                           multiple: int = 32) -> List[int]:
+    """
+    Côtés de buckets en progression géométrique (raison ``step``),
+    arrondis au multiple de ``multiple`` (lui-même multiple de 16).
+    """
+    sizes, size = [], float(min_size)
+    while size < max_size * step:
+        rounded = min(max_size, int(-(-size // multiple) * multiple))
+        if not sizes or rounded > sizes[-1]:
+            sizes.append(rounded)
+        size *= step
+    return sizes
+
+
+EXACT_BUCKET = "exact"  # Clé commune des formes hors buckets
+
+
+class BucketPolicy:
+    """
+    Arrondit les tailles paddées à un petit ensemble de dimensions (buckets).
+    
+    Sans bucketing, chaque image a sa propre forme après padding : aucun
+    batch possible entre tailles voisines et les plans cuDNN/oneDNN sont
+    recalculés à chaque requête. Chaque côté (multiple de 16) est arrondi au
+    plus petit bucket qui le contient ; si cela ajoute plus de
+    ``max_extra_pixels`` par rapport au padding minimal, ou si l'image
+    dépasse le plus grand bucket, le padding minimal est conservé.
+    
+    Les statistiques (et le label Prometheus transmis au listener) ne sont
+    tenues par forme que pour les buckets configurés : toutes les formes
+    exactes de repli partagent l'entrée ``"exact"``, pour que leur nombre
+    reste borné sur un serveur de longue durée.
+    
+    Args:
+        sizes: Côtés autorisés, multiples de 16 (défaut : geometric_bucket_sizes())
+        max_extra_pixels: Pixels de padding supplémentaires tolérés par requête
+        listener: Appelé à chaque padding avec (bucket "HxW" ou "exact", pixels image, pixels paddés)
+    """
+    
+    def __init__(self, sizes: Optional[Sequence[int]] = None, max_extra_pixels: int = 256 * 256,
+                 listener: Optional[Callable[[str, int, int], None]] = None):
+        self.sizes = sorted(set(sizes or geometric_bucket_sizes()))
+        if any(size % 16 != 0 for size in self.sizes):
+            raise ValueError("Les tailles de buckets doivent être des multiples de 16")
+        self.max_extra_pixels = max_extra_pixels
+        self.listener = listener
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+    
+    def _round_up(self, value: int) -> Optional[int]:
+        for size in self.sizes:
+            if size >= value:
+                return size
+        return None
+    
+    def target_size(self, height: int, width: int) -> Tuple[int, int]:
+        """Taille (H, W) paddée pour une entrée (H, W) : bucket, ou multiple de 16."""
+        exact_h, exact_w = (height + 15) // 16 * 16, (width + 15) // 16 * 16
+        bucket_h, bucket_w = self._round_up(exact_h), self._round_up(exact_w)
+        if bucket_h is None or bucket_w is None:
+            return exact_h, exact_w
+        if bucket_h * bucket_w - exact_h * exact_w > self.max_extra_pixels:
+            return exact_h, exact_w
+        return bucket_h, bucket_w
+    
+    def bucket_key(self, target: Tuple[int, int]) -> str:
+        """Clé de statistiques d'une forme paddée : ``"HxW"`` si c'est un bucket, sinon ``"exact"``."""
+        if target[0] in self.sizes and target[1] in self.sizes:
+            return f"{target[0]}x{target[1]}"
+        return EXACT_BUCKET
+    
+    def record(self, height: int, width: int, target: Tuple[int, int]):
+        """Comptabilise l'utilisation d'une forme paddée."""
+        key = self.bucket_key(target)
+        padded_pixels = target[0] * target[1]
+        with self._lock:
+            entry = self._stats.setdefault(key, {"requests": 0, "image_pixels": 0, "padded_pixels": 0})
+            entry["requests"] += 1
+            entry["image_pixels"] += height * width
+            entry["padded_pixels"] += padded_pixels
+        if self.listener is not None:
+            self.listener(key, height * width, padded_pixels)
+    
+    def stats(self) -> Dict:
+        """Réutilisation par bucket et part de calcul perdue dans le padding."""
+        with self._lock:
+            buckets = {key: dict(entry) for key, entry in self._stats.items()}
+        requests = sum(entry["requests"] for entry in buckets.values())
+        image_pixels = sum(entry["image_pixels"] for entry in buckets.values())
+        padded_pixels = sum(entry["padded_pixels"] for entry in buckets.values())
+        exact_requests = buckets.get(EXACT_BUCKET, {}).get("requests", 0)
+        bucket_shapes = len(buckets) - (EXACT_BUCKET in buckets)
+        # Les formes exactes sont comptées comme jamais réutilisées (majorant du coût)
+        reused = requests - exact_requests - bucket_shapes
+        return {
+            "requests": requests,
+            "exact_requests": exact_requests,
+            "distinct_shapes": bucket_shapes,
+            "reuse_ratio": reused / requests if requests else 0.0,
+            "waste_ratio": 1 - image_pixels / padded_pixels if padded_pixels else 0.0,
+            "buckets": dict(sorted(buckets.items(), key=lambda item: item[1]["requests"], reverse=True)),
+        }
+
+
+def pad_to_size(tensor: torch.Tensor, size: Tuple[int, int]) -> Tuple[torch.Tensor, Tuple[int, int, int, int]]:
+    """
+    Ajoute du padding équilibré pour atteindre la taille (H, W) donnée.
+    Mode 'reflect', ou 'replicate' si le padding dépasse la taille de l'image
+    (cas d'une petite image dans un grand bucket).
+    
+    Returns:
+        Tuple contenant :
+        - Tenseur paddé
+        - Padding appliqué (left, right, top, bottom)
+    """
+    _, _, h, w = tensor.shape
+    pad_h, pad_w = size[0] - h, size[1] - w
+    
+    pad_top = pad_h // 2
+    pad_bottom = pad_h - pad_top
+    pad_left = pad_w // 2
+    pad_right = pad_w - pad_left
+    
+    if pad_h > 0 or pad_w > 0:
+        mode = 'reflect' if max(pad_top, pad_bottom) < h and max(pad_left, pad_right) < w else 'replicate'
+        tensor = F.pad(tensor, (pad_left, pad_right, pad_top, pad_bottom), mode=mode)
+    
+    return tensor, (pad_left, pad_right, pad_top, pad_bottom)
+
+
+def pad_to_bucket(tensor: torch.Tensor, policy: BucketPolicy) -> Tuple[torch.Tensor, Tuple[int, int, int, int]]:
+    """
+    Padding vers le bucket choisi par ``policy`` (statistiques mises à jour).
+    """
+    _, _, h, w = tensor.shape
+    target = policy.target_size(h, w)
+    policy.record(h, w, target)
+    return pad_to_size(tensor, target)
+
+
+def _pad(tensor: torch.Tensor, bucket_policy: Optional[BucketPolicy]):
+    """Padding par bucket si une politique est fournie, sinon au multiple de 16."""
+    if bucket_policy is not None:
+        return pad_to_bucket(tensor, bucket_policy)
+    return pad_to_multiple_of_16(tensor)
+
+
 def remove_padding(tensor: torch.Tensor, padding: Tuple[int, int, int, int]) -> torch.Tensor:
     """
     Retire le padding ajouté précédemment.
@@ -174,7 +329,8 @@ def postprocess_image(tensor: torch.Tensor) -> Image.Image:
     return image
 
 
-def infer_single(model: torch.nn.Module, image: Image.Image, device: torch.device, quality: int = 5) -> Image.Image:
+def infer_single(model: torch.nn.Module, image: Image.Image, device: torch.device, quality: int = 5,
+                 timer=None, bucket_policy: Optional[BucketPolicy] = None) -> Image.Image:
     """
     Effectue l'inférence complète sur une seule image avec résidual learning.
     
@@ -188,19 +344,23 @@ def infer_single(model: torch.nn.Module, image: Image.Image, device: torch.devic
         image: Image PIL à restaurer
         device: Device PyTorch
         quality: Qualité JPEG estimée (5-30)
+        timer: StageTimer optionnel pour mesurer chaque étape
+        bucket_policy: Politique de bucketing (None = padding au multiple de 16)
     
     Returns:
         Image restaurée
     """
     # Prétraitement (avec canal Q)
-    img_tensor, original_size = preprocess_image(image, quality)
-    img_tensor = img_tensor.to(device)
+    with _stage(timer, "preprocess"):
+        img_tensor, original_size = preprocess_image(image, quality)
+        img_tensor = img_tensor.to(device)
     
     # Padding
-    img_padded, padding = pad_to_multiple_of_16(img_tensor)
+    with _stage(timer, "pad"):
+        img_padded, padding = _pad(img_tensor, bucket_policy)
     
     # Inférence
-    with torch.no_grad():
+    with _stage(timer, "forward"), torch.no_grad():
         if device.type == 'cuda':
             with torch.amp.autocast('cuda'):
                 # 🆕 Le modèle retourne un delta
@@ -209,26 +369,34 @@ def infer_single(model: torch.nn.Module, image: Image.Image, device: torch.devic
             delta = model(img_padded)
     
     # 🆕 Reconstruction résiduelle
-    # Extraire les 3 premiers canaux RGB de l'input
-    input_rgb = img_padded[:, :3, :, :]
-    
-    # Ajouter le delta
-    restored = input_rgb + delta
-    
-    # Clamp dans [-1, 1]
-    restored = torch.clamp(restored, -1, 1)
-    
-    # Retirer le padding
-    restored = remove_padding(restored, padding)
+    with _stage(timer, "residual"):
+        # Extraire les 3 premiers canaux RGB de l'input
+        input_rgb = img_padded[:, :3, :, :]
+        
+        # Ajouter le delta
+        restored = input_rgb + delta
+        
+        # Clamp dans [-1, 1]
+        restored = torch.clamp(restored, -1, 1)
+        
+        # Retirer le padding
+        restored = remove_padding(restored, padding)
     
     # Post-traitement
-    restored_image = postprocess_image(restored)
+    with _stage(timer, "postprocess"):
+        restored_image = postprocess_image(restored)
     
     return restored_image
 
 
+def full_tile_size(tile_size: int = 512, overlap: int = 32) -> int:
+    """Côté d'une tuile intérieure de infer_tiled (tuile + chevauchement des deux côtés)."""
+    return tile_size + 2 * overlap
+
+
 def infer_tiled(model: torch.nn.Module, image: Image.Image, device: torch.device,
-                tile_size: int = 512, overlap: int = 32, quality: int = 10) -> Image.Image:
+                tile_size: int = 512, overlap: int = 32, quality: int = 10, timer=None,
+                bucket_policy: Optional[BucketPolicy] = None) -> Image.Image:
     """
     Effectue l'inférence par tuiles pour les images très grandes avec résidual learning.
     Permet d'éviter les erreurs de mémoire (OOM).
@@ -245,13 +413,18 @@ def infer_tiled(model: torch.nn.Module, image: Image.Image, device: torch.device
         tile_size: Taille des tuiles (doit être multiple de 16)
         overlap: Chevauchement entre tuiles pour éviter les artefacts
         quality: Qualité JPEG estimée (5-30)
+        timer: StageTimer optionnel pour mesurer chaque étape
+        bucket_policy: Politique de bucketing des tuiles de bord (les tuiles
+            pleines gardent leur forme ; ajouter full_tile_size() aux buckets
+            pour que les bords la partagent)
     
     Returns:
         Image restaurée
     """
     # Prétraitement (avec canal Q)
-    img_tensor, original_size = preprocess_image(image, quality)
-    img_tensor = img_tensor.to(device)
+    with _stage(timer, "preprocess"):
+        img_tensor, original_size = preprocess_image(image, quality)
+        img_tensor = img_tensor.to(device)
     
     _, _, h, w = img_tensor.shape
     
@@ -261,6 +434,7 @@ def infer_tiled(model: torch.nn.Module, image: Image.Image, device: torch.device
     
     # Calculer le stride
     stride = tile_size - overlap * 2
+    full_tile = full_tile_size(tile_size, overlap)
     
     # Parcourir l'image par tuiles
     for y in range(0, h, stride):
@@ -273,11 +447,14 @@ def infer_tiled(model: torch.nn.Module, image: Image.Image, device: torch.device
             
             tile = img_tensor[:, :, y_start:y_end, x_start:x_end]
             
-            # Padding de la tuile
-            tile_padded, padding = pad_to_multiple_of_16(tile)
+            # Padding de la tuile : les tuiles pleines ont déjà une forme unique
+            # (multiple de 16), seules les tuiles de bord passent par les buckets
+            with _stage(timer, "pad"):
+                is_full_tile = tuple(tile.shape[2:]) == (full_tile, full_tile) and full_tile % 16 == 0
+                tile_padded, padding = _pad(tile, None if is_full_tile else bucket_policy)
             
-            # Inférence
-            with torch.no_grad():
+            # Inférence (mesurée par tuile)
+            with _stage(timer, "forward_tile"), torch.no_grad():
                 if device.type == 'cuda':
                     with torch.amp.autocast('cuda'):
                         # 🆕 Le modèle retourne un delta
@@ -286,12 +463,13 @@ def infer_tiled(model: torch.nn.Module, image: Image.Image, device: torch.device
                     delta = model(tile_padded)
             
             # 🆕 Reconstruction résiduelle
-            tile_rgb = tile_padded[:, :3, :, :]
-            tile_restored = tile_rgb + delta
-            tile_restored = torch.clamp(tile_restored, -1, 1)
-            
-            # Retirer le padding
-            tile_restored = remove_padding(tile_restored, padding)
+            with _stage(timer, "residual"):
+                tile_rgb = tile_padded[:, :3, :, :]
+                tile_restored = tile_rgb + delta
+                tile_restored = torch.clamp(tile_restored, -1, 1)
+                
+                # Retirer le padding
+                tile_restored = remove_padding(tile_restored, padding)
             
             # Calculer les poids (gaussian pour smooth blending)
             tile_h, tile_w = tile_restored.shape[2:]
@@ -305,13 +483,98 @@ def infer_tiled(model: torch.nn.Module, image: Image.Image, device: torch.device
     output_tensor = output_tensor / weight_tensor
     
     # Post-traitement
-    restored_image = postprocess_image(output_tensor)
+    with _stage(timer, "postprocess"):
+        restored_image = postprocess_image(output_tensor)
     
     return restored_image
 
 
+def padded_size(width: int, height: int, bucket_policy: Optional[BucketPolicy] = None) -> Tuple[int, int]:
+    """
+    Taille (H, W) de l'image après padding (bucket, ou multiple de 16).
+    Deux images de même taille paddée peuvent partager un forward batché.
+    """
+    if bucket_policy is not None:
+        return bucket_policy.target_size(height, width)
+    return (height + 15) // 16 * 16, (width + 15) // 16 * 16
+
+
+def infer_batch(model: torch.nn.Module, images: List[Image.Image], device: torch.device,
+                quality: int = 5, timer=None, bucket_policy: Optional[BucketPolicy] = None) -> List[Image.Image]:
+    """
+    Effectue l'inférence sur plusieurs images en un seul forward batché.
+    
+    Les images doivent avoir la même taille une fois paddées (voir padded_size,
+    avec la même bucket_policy) et une orientation déjà corrigée. Chaque image garde son propre padding,
+    retiré après la reconstruction résiduelle.
+    
+    Args:
+        model: Modèle U-Net
+        images: Images PIL à restaurer
+        device: Device PyTorch
+        quality: Qualité JPEG estimée (5-30)
+        timer: StageTimer optionnel pour mesurer chaque étape
+        bucket_policy: Politique de bucketing (None = padding au multiple de 16)
+    
+    Returns:
+        Images restaurées, dans le même ordre
+    """
+    # Prétraitement (avec canal Q)
+    with _stage(timer, "preprocess"):
+        tensors = [preprocess_image(image, quality)[0] for image in images]
+    
+    # Padding puis empilement en un batch (B, 4, H, W)
+    with _stage(timer, "pad"):
+        padded = [_pad(tensor, bucket_policy) for tensor in tensors]
+        batch = torch.cat([tensor for tensor, _ in padded], dim=0).to(device)
+    
+    # Inférence
+    with _stage(timer, "forward"), torch.no_grad():
+        if device.type == 'cuda':
+            with torch.amp.autocast('cuda'):
+                delta = model(batch)
+        else:
+            delta = model(batch)
+    
+    # Reconstruction résiduelle puis retrait du padding propre à chaque image
+    with _stage(timer, "residual"):
+        restored = torch.clamp(batch[:, :3, :, :] + delta, -1, 1)
+        restored = [
+            remove_padding(restored[i:i + 1], padding)
+            for i, (_, padding) in enumerate(padded)
+        ]
+    
+    # Post-traitement
+    with _stage(timer, "postprocess"):
+        return [postprocess_image(tensor) for tensor in restored]
+
+
+def warmup(model: torch.nn.Module, device: torch.device, shapes: Sequence[Tuple[int, int]]):
+    """
+    Forward à blanc sur chaque forme (H, W) : remplit les caches de plans
+    cuDNN/oneDNN avant les premières requêtes (typiquement les buckets
+    les plus fréquents).
+    """
+    with torch.no_grad():
+        for height, width in shapes:
+            x = torch.zeros((1, model.n_channels, height, width), device=device)
+            if device.type == 'cuda':
+                with torch.amp.autocast('cuda'):
+                    model(x)
+            else:
+                model(x)
+
+
+def should_use_tiling(image: Image.Image, max_size: int = 3000) -> bool:
+    """
+    Indique si l'image est assez grande pour nécessiter l'inférence par tuiles.
+    """
+    return max(image.width, image.height) > max_size
+
+
 def restore_image(model: torch.nn.Module, image: Image.Image, device: torch.device,
-                  use_tiling: bool = None, max_size: int = 3000, quality: int = 5) -> Image.Image:
+                  use_tiling: bool = None, max_size: int = 3000, quality: int = 5,
+                  timer=None, bucket_policy: Optional[BucketPolicy] = None) -> Image.Image:
     """
     Fonction principale de restauration d'image avec modèle optimisé.
     Choisit automatiquement entre inférence normale ou par tuiles.
@@ -327,16 +590,18 @@ def restore_image(model: torch.nn.Module, image: Image.Image, device: torch.devi
         use_tiling: Forcer l'utilisation de tuiles (None = auto)
         max_size: Taille maximale avant d'utiliser les tuiles
         quality: Qualité JPEG estimée (5-30) pour le conditioning
+        timer: StageTimer optionnel pour mesurer chaque étape
+        bucket_policy: Politique de bucketing (None = padding au multiple de 16)
     
     Returns:
         Image restaurée
     """
     # Décider si on utilise les tuiles
     if use_tiling is None:
-        use_tiling = max(image.width, image.height) > max_size
+        use_tiling = should_use_tiling(image, max_size)
     
     if use_tiling:
         print(f"Image large ({image.width}x{image.height}), utilisation de l'inférence par tuiles")
-        return infer_tiled(model, image, device, quality=quality)
+        return infer_tiled(model, image, device, quality=quality, timer=timer, bucket_policy=bucket_policy)
     else:
-        return infer_single(model, image, device, quality=quality)
+        return infer_single(model, image, device, quality=quality, timer=timer, bucket_policy=bucket_policy)
@@ -0,0 +1,479 @@
+"""
+Test de charge de l'API, entièrement hors ligne (urllib + threads).
+
+Démarre l'API sur localhost dans un sous-processus uvicorn (ou cible un
+serveur existant avec --url), rejoue un mélange pondéré de tailles d'images
+et d'endpoints, à concurrence fixe (boucle fermée) ou à débit cible
+(boucle ouverte), puis affiche débit, latences p50/p95/p99, taux d'erreurs
+et de rejets, et la mémoire du serveur échantillonnée sur /metrics.
+
+Sans checkpoint (models/best_model.pth absent), un U-Net réduit initialisé
+aléatoirement est utilisé : les latences ne sont alors comparables qu'entre
+elles, mais le comportement de l'admission et de la concurrence est réel.
+
+Usage :
+    python loadtest.py --concurrency 4 --duration 30
+    python loadtest.py --rate 5 --duration 60 --sizes 256x256:4 1024x768:1 --endpoints /restore:3 /restore-jpeg:1
+    python loadtest.py --url http://localhost:8000 --concurrency 8 --json results/load.json
+    python loadtest.py --tiny --concurrency 4 --max-p95-ms 2000 --max-error-rate 0.01
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from model import UNet, DEFAULT_WIDTHS
+from prune import synthetic_image, count_parameters
+from benchmark import print_table
+
+
+REJECTED_STATUSES = {429, 503}  # Refus explicites (limitation / délestage à l'admission)
+SERVER_GAUGES = (
+    "process_resident_memory_bytes",
+    "unblurai_queue_depth",
+    "unblurai_requests_in_flight",
+    "unblurai_pixels_in_flight",
+)
+
+
+@dataclass
+class Sample:
+    """Résultat d'une requête."""
+    start: float
+    endpoint: str
+    size: str
+    status: int
+    latency_ms: float
+
+
+# ---------------------------------------------------------------------------
+# Serveur
+# ---------------------------------------------------------------------------
+
+def tiny_checkpoint(path: str, scale: int = 8, seed: int = 0) -> int:
+    """
+    Écrit un U-Net aléatoire dont toutes les largeurs sont divisées par
+    ``scale`` (format model_config, chargé tel quel par load_model).
+
+    Returns:
+        Nombre de paramètres du modèle
+    """
+    torch.manual_seed(seed)
+    model = UNet(widths={key: max(4, width // scale) for key, width in DEFAULT_WIDTHS.items()})
+    torch.save({"model_state_dict": model.state_dict(), "model_config": model.config()}, path)
+    return count_parameters(model)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(model_path: str, port: int, log_path: str) -> subprocess.Popen:
+    """Lance l'API dans un processus séparé (mémoire serveur isolée du client)."""
+    env = {**os.environ, "UNBLURAI_MODEL_PATH": os.path.abspath(model_path)}
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+def wait_ready(url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    """Attend que /health indique un modèle chargé."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (code {process.returncode})")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as response:
+                if json.load(response).get("model_loaded"):
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Serveur non prêt après {timeout:.0f}s ({url}/health)")
+
+
+# ---------------------------------------------------------------------------
+# Requêtes
+# ---------------------------------------------------------------------------
+
+def parse_weighted(values: List[str]) -> List[Tuple[str, float]]:
+    """``["/restore:3", "/restore-jpeg"]`` -> ``[("/restore", 3.0), ("/restore-jpeg", 1.0)]``."""
+    mix = []
+    for value in values:
+        item, _, weight = value.rpartition(":")
+        if not item or not weight.replace(".", "", 1).isdigit():
+            item, weight = value, "1"
+        mix.append((item, float(weight)))
+    return mix
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    """``"1024x768"`` -> ``(1024, 768)`` (largeur, hauteur)."""
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def make_payloads(sizes: List[str], jpeg_quality: int, seed: int) -> Dict[str, bytes]:
+    """Une image JPEG synthétique compressée par taille demandée."""
+    rng = np.random.default_rng(seed)
+    payloads = {}
+    for size in sizes:
+        width, height = parse_size(size)
+        image = synthetic_image(max(width, height), rng).crop((0, 0, width, height))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=jpeg_quality)
+        payloads[size] = buffer.getvalue()
+    return payloads
+
+
+def encode_multipart(filename: str, data: bytes) -> Tuple[bytes, str]:
+    """Corps multipart/form-data avec un unique champ ``file``."""
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def post(url: str, body: bytes, content_type: str, timeout: float) -> int:
+    """Envoie la requête, lit toute la réponse et retourne le code HTTP (0 si erreur réseau)."""
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return 0
+
+
+class LoadGenerator:
+    """Rejoue le mélange d'endpoints et de tailles contre le serveur."""
+
+    def __init__(self, url: str, endpoints: List[Tuple[str, float]], sizes: List[Tuple[str, float]],
+                 payloads: Dict[str, bytes], timeout: float = 120.0, seed: int = 0):
+        self.url = url
+        self.endpoints = endpoints
+        self.sizes = sizes
+        self.payloads = payloads
+        self.timeout = timeout
+        self.seed = seed
+        self.samples: List[Sample] = []
+        self._lock = threading.Lock()
+        # Corps multipart précalculés : le client ne doit pas être le goulot
+        self._bodies = {size: encode_multipart(f"load_{size}.jpg", data) for size, data in payloads.items()}
+
+    def _choose(self, rng: random.Random) -> Tuple[str, str]:
+        endpoint = rng.choices([e for e, _ in self.endpoints], weights=[w for _, w in self.endpoints])[0]
+        size = rng.choices([s for s, _ in self.sizes], weights=[w for _, w in self.sizes])[0]
+        return endpoint, size
+
+    def _send(self, endpoint: str, size: str, scheduled: float, record: bool = True):
+        body, content_type = self._bodies[size]
+        status = post(f"{self.url}{endpoint}", body, content_type, self.timeout)
+        # Latence mesurée depuis l'instant prévu (boucle ouverte : inclut le retard d'envoi)
+        sample = Sample(scheduled, endpoint, size, status, (time.perf_counter() - scheduled) * 1000)
+        if record:
+            with self._lock:
+                self.samples.append(sample)
+
+    def warmup(self, count: int):
+        """Requêtes non comptabilisées (chargement, premières formes)."""
+        rng = random.Random(self.seed)
+        for _ in range(count):
+            for size, _ in self.sizes:
+                self._send(self._choose(rng)[0], size, time.perf_counter(), record=False)
+
+    def run_concurrency(self, concurrency: int, duration: float, max_requests: Optional[int] = None):
+        """Boucle fermée : ``concurrency`` clients enchaînent les requêtes."""
+        deadline = time.perf_counter() + duration
+        counter = iter(range(max_requests)) if max_requests else None
+
+        def worker(index: int):
+            rng = random.Random(self.seed + index)
+            while time.perf_counter() < deadline:
+                if counter is not None and next(counter, None) is None:
+                    return
+                self._send(*self._choose(rng), time.perf_counter())
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_rate(self, rate: float, duration: float, max_workers: int = 64,
+                 max_requests: Optional[int] = None):
+        """Boucle ouverte : arrivées de Poisson à ``rate`` requêtes/s, quel que soit le temps de réponse."""
+        rng = random.Random(self.seed)
+        start = time.perf_counter()
+        scheduled = start
+        sent = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                scheduled += rng.expovariate(rate)
+                if scheduled - start > duration or (max_requests and sent >= max_requests):
+                    break
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                executor.submit(self._send, *self._choose(rng), scheduled)
+                sent += 1
+
+
+# ---------------------------------------------------------------------------
+# Mémoire serveur
+# ---------------------------------------------------------------------------
+
+def read_gauges(url: str, names=SERVER_GAUGES) -> Dict[str, float]:
+    """Valeurs courantes de quelques séries /metrics (sommées sur les labels)."""
+    with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+        text = response.read().decode("utf-8")
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        name = name.split("{", 1)[0]
+        if name in names:
+            values[name] = values.get(name, 0.0) + float(value)
+    return values
+
+
+class MetricsSampler(threading.Thread):
+    """Échantillonne /metrics à intervalle régulier pendant le test."""
+
+    def __init__(self, url: str, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.url = url
+        self.interval = interval
+        self.timeline: List[Dict[str, float]] = []
+        self._done = threading.Event()
+
+    def run(self):
+        start = time.perf_counter()
+        while not self._done.is_set():
+            try:
+                self.timeline.append({"t": time.perf_counter() - start, **read_gauges(self.url)})
+            except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+                pass
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+# ---------------------------------------------------------------------------
+# Rapport
+# ---------------------------------------------------------------------------
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict:
+    """Débit, latences (requêtes réussies) et taux d'erreurs d'un ensemble d'échantillons."""
+    ok = [s.latency_ms for s in samples if 200 <= s.status < 300]
+    total = len(samples)
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        statuses[str(s.status)] = statuses.get(str(s.status), 0) + 1
+    p50, p95, p99 = np.percentile(ok, [50, 95, 99]) if ok else (float("nan"),) * 3
+    return {
+        "requests": total,
+        "ok": len(ok),
+        "throughput_rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "error_rate": (total - len(ok)) / total if total else 0.0,
+        "rejected_rate": sum(statuses.get(str(c), 0) for c in REJECTED_STATUSES) / total if total else 0.0,
+        "rate_429": statuses.get("429", 0) / total if total else 0.0,
+        "statuses": statuses,
+    }
+
+
+def build_report(samples: List[Sample], elapsed: float, timeline: List[Dict]) -> Dict:
+    report = {"overall": summarize(samples, elapsed), "by_endpoint": {}, "by_size": {}}
+    for key, attr in (("by_endpoint", "endpoint"), ("by_size", "size")):
+        for value in sorted({getattr(s, attr) for s in samples}):
+            report[key][value] = summarize([s for s in samples if getattr(s, attr) == value], elapsed)
+
+    rss = [point["process_resident_memory_bytes"] for point in timeline
+           if "process_resident_memory_bytes" in point]
+    report["memory"] = {
+        "rss_start_mb": rss[0] / 1e6 if rss else None,
+        "rss_peak_mb": max(rss) / 1e6 if rss else None,
+        "rss_end_mb": rss[-1] / 1e6 if rss else None,
+    }
+    report["timeline"] = timeline
+    return report
+
+
+def print_report(report: Dict, elapsed: float):
+    overall = report["overall"]
+    print(f"\n📊 {overall['requests']} requêtes en {elapsed:.1f}s - "
+          f"{overall['throughput_rps']:.2f} req/s réussies, statuts {overall['statuses']}\n")
+    columns = [
+        ("name", "", "{}"),
+        ("requests", "requêtes", "{}"),
+        ("throughput_rps", "req/s", "{:.2f}"),
+        ("p50_ms", "p50 (ms)", "{:.0f}"),
+        ("p95_ms", "p95 (ms)", "{:.0f}"),
+        ("p99_ms", "p99 (ms)", "{:.0f}"),
+        ("error_rate", "erreurs", "{:.1%}"),
+        ("rejected_rate", "rejets 429/503", "{:.1%}"),
+    ]
+    rows = [{"name": "total", **overall}]
+    rows += [{"name": name, **stats} for name, stats in report["by_endpoint"].items()]
+    rows += [{"name": name, **stats} for name, stats in report["by_size"].items()]
+    print_table(rows, columns)
+
+    timeline = [p for p in report["timeline"] if "process_resident_memory_bytes" in p]
+    if timeline:
+        print("\n🧠 Mémoire serveur (RSS) et file d'attente\n")
+        step = max(1, len(timeline) // 10)
+        points = timeline[::step] + ([timeline[-1]] if (len(timeline) - 1) % step else [])
+        print_table([{
+            "t": p["t"],
+            "rss_mb": p["process_resident_memory_bytes"] / 1e6,
+            "queue": p.get("unblurai_queue_depth", 0),
+            "in_flight": p.get("unblurai_requests_in_flight", 0),
+            "mpx": p.get("unblurai_pixels_in_flight", 0) / 1e6,
+        } for p in points], [
+            ("t", "t (s)", "{:.1f}"),
+            ("rss_mb", "RSS (MB)", "{:.0f}"),
+            ("queue", "file", "{:.0f}"),
+            ("in_flight", "en cours", "{:.0f}"),
+            ("mpx", "MP admis", "{:.1f}"),
+        ])
+        memory = report["memory"]
+        print(f"\n   RSS début {memory['rss_start_mb']:.0f} MB, pic {memory['rss_peak_mb']:.0f} MB, "
+              f"fin {memory['rss_end_mb']:.0f} MB")
+    else:
+        print("\n⚠️  process_resident_memory_bytes indisponible (plateforme sans /proc ?)")
+
+
+def check_gates(report: Dict, max_p95_ms: Optional[float], max_error_rate: Optional[float]) -> List[str]:
+    """Seuils non respectés (pour faire échouer un job CI)."""
+    overall = report["overall"]
+    failures = []
+    if max_p95_ms is not None and not overall["p95_ms"] <= max_p95_ms:
+        failures.append(f"p95 {overall['p95_ms']:.0f} ms > {max_p95_ms:.0f} ms")
+    if max_error_rate is not None and overall["error_rate"] > max_error_rate:
+        failures.append(f"taux d'erreurs {overall['error_rate']:.1%} > {max_error_rate:.1%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge hors ligne de l'API UnblurAI")
+    parser.add_argument("--url", help="Serveur existant (sinon l'API est lancée sur localhost)")
+    parser.add_argument("--model", default="models/best_model.pth",
+                        help="Checkpoint du serveur lancé (U-Net réduit aléatoire s'il est absent)")
+    parser.add_argument("--tiny", action="store_true", help="Forcer le U-Net réduit aléatoire")
+    parser.add_argument("--model-scale", type=int, default=8, help="Diviseur des largeurs du U-Net réduit")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=4, help="Clients simultanés (boucle fermée)")
+    load.add_argument("--rate", type=float, help="Débit cible en requêtes/s (boucle ouverte)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durée du test (s)")
+    parser.add_argument("--requests", type=int, help="Nombre maximum de requêtes")
+    parser.add_argument("--max-workers", type=int, default=64, help="Requêtes simultanées max en boucle ouverte")
+    parser.add_argument("--sizes", nargs="+", default=["256x256:4", "640x480:2", "1920x1080:1"],
+                        help="Tailles LxH pondérées (ex : 512x512:3)")
+    parser.add_argument("--endpoints", nargs="+", default=["/restore:3", "/restore-jpeg:1"],
+                        help="Endpoints pondérés, paramètres de requête acceptés (ex : /restore?quality=10:2)")
+    parser.add_argument("--jpeg-quality", type=int, default=15, help="Qualité JPEG des images envoyées")
+    parser.add_argument("--warmup", type=int, default=1, help="Passes de préchauffage par taille")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout par requête (s)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Intervalle d'échantillonnage /metrics (s)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p95-ms", type=float, help="Échec si le p95 global dépasse ce seuil")
+    parser.add_argument("--max-error-rate", type=float, help="Échec si le taux d'erreurs dépasse ce seuil (0-1)")
+    parser.add_argument("--json", help="Écrire le rapport dans ce fichier JSON")
+    args = parser.parse_args()
+
+    sizes = parse_weighted(args.sizes)
+    endpoints = parse_weighted(args.endpoints)
+    payloads = make_payloads([size for size, _ in sizes], args.jpeg_quality, args.seed)
+
+    workdir = tempfile.TemporaryDirectory(prefix="unblurai_load_")
+    server = None
+    url = args.url.rstrip("/") if args.url else None
+    try:
+        if url is None:
+            model_path = args.model
+            if args.tiny or not os.path.exists(model_path):
+                if not args.tiny:
+                    print(f"⚠️  '{model_path}' introuvable : U-Net réduit aléatoire (latences non représentatives)")
+                model_path = os.path.join(workdir.name, "tiny.pth")
+                params = tiny_checkpoint(model_path, args.model_scale, args.seed)
+                print(f"🧪 U-Net réduit (largeurs / {args.model_scale}) : {params:,} paramètres")
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            log_path = os.path.join(workdir.name, "server.log")
+            print(f"🚀 Démarrage de l'API sur {url}...")
+            server = start_server(model_path, port, log_path)
+        wait_ready(url, args.startup_timeout, server)
+
+        generator = LoadGenerator(url, endpoints, sizes, payloads, timeout=args.timeout, seed=args.seed)
+        if args.warmup > 0:
+            print("🔥 Préchauffage...")
+            generator.warmup(args.warmup)
+
+        sampler = MetricsSampler(url, args.sample_interval)
+        sampler.start()
+        mode = f"{args.rate:g} req/s" if args.rate else f"concurrence {args.concurrency}"
+        print(f"⏱️  Charge : {mode}, {args.duration:g}s, tailles {args.sizes}, endpoints {args.endpoints}")
+        start = time.perf_counter()
+        if args.rate:
+            generator.run_rate(args.rate, args.duration, args.max_workers, args.requests)
+        else:
+            generator.run_concurrency(args.concurrency, args.duration, args.requests)
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        workdir.cleanup()
+
+    report = build_report(generator.samples, elapsed, sampler.timeline)
+    report["config"] = {**vars(args), "url": url, "elapsed_s": elapsed}
+    print_report(report, elapsed)
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Rapport écrit dans {args.json}")
+
+    failures = check_gates(report, args.max_p95_ms, args.max_error_rate)
+    if failures:
+        print(f"\n❌ Seuils non respectés : {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,57 @@ API FastAPI pour la restauration d'images avec U-Net.
 import os
 import io
 import sys
+import time
+import json
+import zipfile
+import itertools
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from contextlib import asynccontextmanager
+from typing import Iterator, List, Optional, Tuple
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Header
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+import numpy as np
 import torch
 from PIL import Image
 
 from model import load_model
-from inference import restore_image
+from inference import (restore_image, should_use_tiling, infer_batch, correct_image_orientation,
+                       BucketPolicy, geometric_bucket_sizes, full_tile_size, warmup)
+import metrics
+import profiling
+from admission import AdmissionController, AdmissionRejected, THROUGHPUT_LANE
+from batch import (BatchItem, BatchGroup, plan_batches, error_payload, safe_filename,
+                   STREAM_WRITERS, ZipStreamWriter)
+from sequence import (SequenceRestorer, SequenceLimitExceeded, iter_sequence_frames, scan_sequence,
+                      SEQUENCE_EXTENSIONS)
+import delta_codec
 
 
 # Configuration
-MODEL_PATH = "models/best_model.pth"
+MODEL_PATH = os.environ.get("UNBLURAI_MODEL_PATH", "models/best_model.pth")
 MAX_FILE_SIZE = 15 * 1024 * 1024  # 15 MB
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+MAX_CONCURRENT_INFERENCES = 1  # Inférences simultanées dans la voie rapide
+THROUGHPUT_LANE_SLOTS = 1  # Inférences simultanées dans la voie débit (grandes images)
+PIXEL_BUDGET = 48_000_000  # Pixels décodés simultanément (toutes requêtes)
+SMALL_IMAGE_PIXELS = 2_000_000  # Seuil de la voie rapide (~2 MP)
+FAST_LANE_RESERVED_PIXELS = 8_000_000  # Part du budget réservée aux petites images
+ADMISSION_DEADLINE_SECONDS = float(os.environ.get("UNBLURAI_DEADLINE_SECONDS", "30"))
+MAX_BATCH_FILES = 32  # Fichiers maximum par requête /restore-batch
+BATCH_MAX_SIZE = 8  # Images maximum par forward batché
+MAX_SEQUENCE_FILE_SIZE = 100 * 1024 * 1024  # 100 MB (archive ZIP ou flux MJPEG)
+MAX_SEQUENCE_FRAMES = 1000  # Images maximum par séquence
+MAX_SEQUENCE_UNCOMPRESSED_SIZE = 500 * 1024 * 1024  # 500 MB d'images décompressées par séquence
+BUCKETING_ENABLED = os.environ.get("UNBLURAI_BUCKETING", "1") == "1"
+BUCKET_MAX_EXTRA_PIXELS = 256 * 256  # Padding supplémentaire toléré pour rejoindre un bucket
+WARMUP_BUCKETS = os.environ.get("UNBLURAI_WARMUP_BUCKETS", "")  # Ex : "256x256,512x512"
+CUDNN_BENCHMARK = os.environ.get("UNBLURAI_CUDNN_BENCHMARK", "0") == "1"  # Autotuning cuDNN par forme
+SERVER_TIMING_ENABLED = os.environ.get("UNBLURAI_SERVER_TIMING", "1") == "1"
+INSTRUMENTED_PATHS = {"/restore", "/restore-jpeg", "/restore-batch", "/restore-sequence"}
+PROFILE_SAMPLE_RATE = float(os.environ.get("UNBLURAI_PROFILE_SAMPLE_RATE", "0"))  # 0-1
+DELTA_TILE_SIZE = 64  # Taille des tuiles du format delta (response_format=delta)
 
 # Initialisation de l'application
 app = FastAPI(
@@ -35,11 +71,277 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id", "X-Delta-Tiles"],  # Lisibles par le frontend
 )
 
 # Variables globales
 model = None
 device = None
+admission_controller = AdmissionController(
+    pixel_budget=PIXEL_BUDGET,
+    small_image_pixels=SMALL_IMAGE_PIXELS,
+    fast_slots=MAX_CONCURRENT_INFERENCES,
+    throughput_slots=THROUGHPUT_LANE_SLOTS,
+    fast_reserved_pixels=FAST_LANE_RESERVED_PIXELS,
+    deadline_seconds=ADMISSION_DEADLINE_SECONDS,
+)
+profile_store = profiling.ProfileStore()
+bucket_policy = (
+    BucketPolicy(
+        # Les buckets incluent le côté des tuiles pleines (576) : tuiles de bord alignées sans surcoût
+        sizes=geometric_bucket_sizes() + [full_tile_size()],
+        max_extra_pixels=BUCKET_MAX_EXTRA_PIXELS,
+        listener=metrics.observe_bucket,
+    )
+    if BUCKETING_ENABLED else None
+)
+
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """
+    Mesure la durée, le nombre de requêtes en cours et le code de statut
+    des endpoints de restauration.
+    
+    call_next rend la main dès les en-têtes : la requête n'est comptée
+    comme terminée qu'à la fin de l'envoi du corps (réponses streamées de
+    /restore-batch et /restore-sequence comprises).
+    """
+    endpoint = request.url.path
+    if endpoint not in INSTRUMENTED_PATHS:
+        return await call_next(request)
+    
+    metrics.IN_FLIGHT.inc()
+    start = time.perf_counter()
+    
+    def finish(status: int):
+        metrics.IN_FLIGHT.dec()
+        metrics.REQUEST_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - start)
+        metrics.REQUESTS_TOTAL.labels(endpoint=endpoint, status=str(status)).inc()
+    
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish(500)
+        raise
+    
+    body_iterator = response.body_iterator
+    
+    async def tracked_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            finish(response.status_code)
+    
+    response.body_iterator = tracked_body()
+    return response
+
+
+@asynccontextmanager
+async def admitted(pixels: int):
+    """
+    Contexte d'admission côté API : convertit un refus du contrôleur
+    en HTTPException (413, ou 503 avec Retry-After).
+    
+    Yields:
+        Voie attribuée (``fast`` ou ``throughput``)
+    """
+    try:
+        async with admission_controller.admit(pixels) as lane:
+            yield lane
+    except AdmissionRejected as e:
+        print(f"⛔ Requête refusée ({e.status_code}) : {e.detail}")
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after is not None else None
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+
+
+async def run_restoration(image: Image.Image, quality: int, timer: metrics.StageTimer,
+                          profile: bool = False) -> Tuple[Image.Image, Optional[str]]:
+    """
+    Passe la requête au contrôleur d'admission, décode l'image puis exécute
+    la restauration dans un thread pour ne pas bloquer la boucle d'événements
+    (les scrapes /metrics restent servis pendant l'inférence).
+    
+    L'image ne doit avoir été qu'ouverte (Image.open) : seul l'en-tête est lu
+    avant l'admission, le décodage complet est facturé sur le budget de pixels.
+    Les grandes images (voie débit) sont toujours traitées par tuiles.
+    
+    Returns:
+        Tuple (image restaurée, identifiant du profil ou None)
+    
+    Raises:
+        HTTPException: 413/503 si la requête est refusée à l'admission,
+            400 si l'image ne peut pas être décodée
+    """
+    async with admitted(image.width * image.height) as lane:
+        try:
+            with timer.stage("decode"):
+                await run_in_threadpool(image.load)
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Impossible de décoder l'image : {str(e)}"
+            )
+        
+        use_tiling = lane == THROUGHPUT_LANE or should_use_tiling(image)
+        mode = "tiled" if use_tiling else "single"
+        profile_id = None
+        with metrics.track_peak_memory(device):
+            if profile:
+                restored, profiler = await run_in_threadpool(
+                    profiling.profile_call, model, device, restore_image, model, image, device,
+                    use_tiling=use_tiling, quality=quality, timer=timer, bucket_policy=bucket_policy
+                )
+                profile_id = profile_store.add(profiler, {
+                    "image_size": [image.width, image.height],
+                    "mode": mode,
+                    "lane": lane,
+                    "quality": quality,
+                })
+            else:
+                restored = await run_in_threadpool(
+                    restore_image, model, image, device,
+                    use_tiling=use_tiling, quality=quality, timer=timer, bucket_policy=bucket_policy
+                )
+        metrics.record_inference(mode, image.width, image.height)
+        return restored, profile_id
+
+
+def _decode_batch_group(group: BatchGroup) -> List[Tuple[BatchItem, Image.Image]]:
+    """
+    Décode et oriente les images d'un lot. Les images illisibles sont
+    marquées en erreur sur leur BatchItem et exclues du résultat.
+    """
+    decoded = []
+    for item in group.items:
+        try:
+            item.image.load()
+            decoded.append((item, correct_image_orientation(item.image)))
+        except Exception as e:
+            item.error = f"Impossible de décoder l'image : {str(e)}"
+            item.status_code = 400
+    return decoded
+
+
+async def run_batch_restoration(group: BatchGroup, quality: int,
+                                timer: metrics.StageTimer) -> List[Tuple[BatchItem, Image.Image]]:
+    """
+    Restaure un lot d'images de même taille paddée en un seul forward.
+    Un lot d'une seule grande image (voie débit) est restauré par tuiles.
+    
+    Returns:
+        Liste (item, image restaurée) ; les items en erreur sont omis
+    """
+    async with admitted(group.pixels) as lane:
+        with timer.stage("decode"):
+            decoded = await run_in_threadpool(_decode_batch_group, group)
+        if not decoded:
+            return []
+        
+        items = [item for item, _ in decoded]
+        images = [image for _, image in decoded]
+        with metrics.track_peak_memory(device):
+            if len(images) == 1 and (lane == THROUGHPUT_LANE or should_use_tiling(images[0])):
+                restored = [await run_in_threadpool(
+                    restore_image, model, images[0], device,
+                    use_tiling=True, quality=quality, timer=timer, bucket_policy=bucket_policy
+                )]
+                mode = "tiled"
+            else:
+                restored = await run_in_threadpool(
+                    infer_batch, model, images, device,
+                    quality=quality, timer=timer, bucket_policy=bucket_policy
+                )
+                mode = "batched"
+        for image in images:
+            metrics.record_inference(mode, image.width, image.height)
+        return list(zip(items, restored))
+
+
+async def stream_batch(items: List[BatchItem], quality: int, writer):
+    """
+    Générateur de la réponse /restore-batch : chaque image est envoyée dès
+    que son lot est restauré, les erreurs sont signalées au fil de l'eau
+    (fichier ``.error.json``) et un ``manifest.json`` clôt la réponse.
+    """
+    manifest = []
+    
+    def error_entry(item: BatchItem) -> bytes:
+        name = f"{item.index:03d}_{item.stem}.error.json"
+        manifest.append({"index": item.index, "filename": item.filename, "output": name,
+                         "status_code": item.status_code, "error": item.error})
+        return writer.add(name, error_payload(item), "application/json")
+    
+    # Erreurs de validation : signalées immédiatement
+    for item in items:
+        if item.error is not None:
+            yield error_entry(item)
+    
+    for group in plan_batches(items, BATCH_MAX_SIZE, SMALL_IMAGE_PIXELS, bucket_policy):
+        timer = metrics.StageTimer(device)
+        try:
+            results = await run_batch_restoration(group, quality, timer)
+        except HTTPException as e:
+            results = []
+            for item in group.items:
+                item.error, item.status_code = e.detail, e.status_code
+        except Exception as e:
+            print(f"❌ Erreur lors de la restauration du lot : {e}")
+            results = []
+            for item in group.items:
+                item.error, item.status_code = f"Erreur lors de la restauration : {str(e)}", 500
+        
+        for item, restored_image in results:
+            with timer.stage("encode"):
+                output_buffer = io.BytesIO()
+                restored_image.save(output_buffer, format="PNG", optimize=True)
+            name = f"{item.index:03d}_restored_{item.stem}.png"
+            manifest.append({"index": item.index, "filename": item.filename, "output": name,
+                             "status_code": 200, "error": None})
+            yield writer.add(name, output_buffer.getvalue(), "image/png")
+        
+        for item in group.items:
+            if item.error is not None:
+                yield error_entry(item)
+    
+    manifest.sort(key=lambda entry: entry["index"])
+    yield writer.add("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"),
+                     "application/json")
+    yield writer.close()
+
+
+def timing_headers(timer: metrics.StageTimer, profile_id: Optional[str] = None) -> dict:
+    """
+    En-tête Server-Timing optionnel avec la durée de chaque étape, et
+    identifiant du profil (X-Profile-Id) si la requête a été profilée.
+    """
+    headers = {}
+    if SERVER_TIMING_ENABLED:
+        headers["Server-Timing"] = timer.server_timing()
+    if profile_id is not None:
+        headers["X-Profile-Id"] = profile_id
+    return headers
+
+
+def parse_warmup_shapes(value: str) -> List[Tuple[int, int]]:
+    """
+    Formes de warmup ``"HxW,HxW"`` (UNBLURAI_WARMUP_BUCKETS). Les entrées
+    invalides (pas deux entiers positifs multiples de 16) sont signalées et
+    ignorées.
+    """
+    shapes = []
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        try:
+            height, width = (int(v) for v in entry.lower().split("x"))
+        except ValueError:
+            print(f"⚠️  Forme de warmup ignorée (format HxW attendu) : '{entry}'")
+            continue
+        if height <= 0 or width <= 0 or height % 16 or width % 16:
+            print(f"⚠️  Forme de warmup ignorée (multiples de 16 attendus) : '{entry}'")
+            continue
+        shapes.append((height, width))
+    return shapes
 
 
 @app.on_event("startup")
@@ -88,11 +390,29 @@ async def startup_event():
         num_params = sum(p.numel() for p in model.parameters())
         print(f"📊 Nombre de paramètres : {num_params:,}")
         
+        # Autotuning cuDNN : rentable seulement si les formes se répètent. Les images
+        # hors buckets gardent leur forme exacte, chacune paie alors un passage
+        # d'autotuning et un plan en cache de plus : à activer explicitement.
+        if device.type == 'cuda' and CUDNN_BENCHMARK:
+            torch.backends.cudnn.benchmark = True
+            print("⚙️  cudnn.benchmark activé")
+        
     except Exception as e:
         print(f"❌ Erreur lors du chargement du modèle : {e}")
         model = None
         return
     
+    # Warmup facultatif : un échec ne doit pas rendre l'API indisponible
+    shapes = parse_warmup_shapes(WARMUP_BUCKETS)
+    if shapes:
+        try:
+            print(f"🔥 Warmup sur {len(shapes)} bucket(s) : {', '.join(f'{h}x{w}' for h, w in shapes)}")
+            warmup(model, device, shapes)
+        except Exception as e:
+            print(f"⚠️  Warmup interrompu : {e}")
+            if device.type == 'cuda':
+                torch.cuda.empty_cache()
+    
     print("=" * 60)
     print("✅ UnblurAI API prête !")
     print(f"📡 Écoutant sur http://0.0.0.0:8000")
@@ -135,8 +455,65 @@ async def health():
     }
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Métriques Prometheus : latences par étape, file d'attente, requêtes
+    en cours, pixels traités, modes d'inférence et pic mémoire.
+    """
+    content, content_type = metrics.render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/debug/buckets")
+async def bucket_stats():
+    """
+    Réutilisation des buckets de padding : requêtes par forme et part du
+    calcul perdue dans le padding.
+    """
+    if bucket_policy is None:
+        return {"enabled": False}
+    return {"enabled": True, "sizes": bucket_policy.sizes,
+            "max_extra_pixels": bucket_policy.max_extra_pixels, **bucket_policy.stats()}
+
+
+@app.get("/debug/profiles")
+async def list_profiles():
+    """
+    Liste les derniers profils par couche (sans le détail des événements).
+    """
+    return {"profiles": profile_store.list()}
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """
+    Détail d'un profil : temps et taille de sortie par bloc du U-Net.
+    """
+    record = profile_store.get(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable")
+    return record
+
+
+@app.get("/debug/profiles/{profile_id}/trace")
+async def get_profile_trace(profile_id: str):
+    """
+    Export Chrome Trace d'un profil (à ouvrir dans chrome://tracing ou Perfetto).
+    """
+    record = profile_store.get(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable")
+    return JSONResponse(
+        content=profiling.to_chrome_trace(record),
+        headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.json"}
+    )
+
+
 @app.post("/restore")
-async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
+async def restore_endpoint(file: UploadFile = File(...), quality: int = 5,
+                           response_format: str = "png", delta_step: int = 1,
+                           x_profile: Optional[str] = Header(None)):
     """
     Endpoint principal de restauration d'images.
     
@@ -147,9 +524,12 @@ async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
     Args:
         file: Fichier image uploadé (JPEG, PNG, WebP)
         quality: Qualité JPEG estimée (5-30, défaut: 10)
+        response_format: "png" (défaut) ou "delta" (résidu seul, voir delta_codec.py)
+        delta_step: Pas de quantification du delta (1 = sans perte, 1-16)
+        x_profile: En-tête X-Profile: 1 pour profiler la requête par couche
     
     Returns:
-        Image restaurée en PNG
+        Image restaurée en PNG, ou delta compact à appliquer sur l'image envoyée
     
     Raises:
         HTTPException: En cas d'erreur de validation ou de traitement
@@ -164,6 +544,13 @@ async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
     # Validation du paramètre quality (5-30)
     quality = max(5, min(30, quality))
     
+    if response_format not in ("png", "delta"):
+        raise HTTPException(
+            status_code=400,
+            detail="Format de réponse inconnu. Formats acceptés : png, delta"
+        )
+    delta_step = max(1, min(16, delta_step))
+    
     # Vérifier l'extension du fichier
     file_ext = Path(file.filename).suffix.lower()
     if file_ext not in ALLOWED_EXTENSIONS:
@@ -172,9 +559,12 @@ async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
             detail=f"Format de fichier non supporté. Formats acceptés : {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
+    timer = metrics.StageTimer(device)
+    
     # Lire le contenu du fichier
     try:
-        contents = await file.read()
+        with timer.stage("read"):
+            contents = await file.read()
     except Exception as e:
         raise HTTPException(
             status_code=400,
@@ -188,7 +578,7 @@ async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
             detail=f"Fichier trop volumineux. Taille maximale : {MAX_FILE_SIZE // (1024*1024)} MB"
         )
     
-    # Décoder l'image
+    # Lire l'en-tête de l'image (le décodage complet a lieu après l'admission)
     try:
         image = Image.open(io.BytesIO(contents))
     except Exception as e:
@@ -209,9 +599,12 @@ async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
     
     # Restauration de l'image avec quality conditioning
     try:
-        restored_image = restore_image(model, image, device, quality=quality)
+        profile = profiling.should_profile(x_profile, PROFILE_SAMPLE_RATE)
+        restored_image, profile_id = await run_restoration(image, quality, timer, profile=profile)
         print(f"✅ Image restaurée avec succès")
         
+    except HTTPException:
+        raise
     except torch.cuda.OutOfMemoryError:
         raise HTTPException(
             status_code=507,
@@ -224,23 +617,47 @@ async def restore_endpoint(file: UploadFile = File(...), quality: int = 5):
             detail=f"Erreur lors de la restauration : {str(e)}"
         )
     
+    stem = file.filename.rsplit('.', 1)[0]
+    
+    # Résidu seul : le client réapplique le delta sur l'image qu'il a envoyée
+    if response_format == "delta":
+        with timer.stage("encode"):
+            original = np.asarray(correct_image_orientation(image).convert("RGB"))
+            payload, stats = await run_in_threadpool(
+                delta_codec.encode_delta, original, np.asarray(restored_image),
+                step=delta_step, tile_size=DELTA_TILE_SIZE
+            )
+        print(f"🧩 Delta : {stats['tiles']}/{stats['tiles_total']} tuiles, {stats['bytes']} octets")
+        return Response(
+            content=payload,
+            media_type=delta_codec.MEDIA_TYPE,
+            headers={
+                "Content-Disposition": f"inline; filename=restored_{stem}.ubd",
+                "X-Delta-Tiles": f"{stats['tiles']}/{stats['tiles_total']}",
+                **timing_headers(timer, profile_id)
+            }
+        )
+    
     # Convertir l'image restaurée en bytes (PNG pour éviter la perte de qualité)
-    output_buffer = io.BytesIO()
-    restored_image.save(output_buffer, format="PNG", optimize=True)
-    output_buffer.seek(0)
+    with timer.stage("encode"):
+        output_buffer = io.BytesIO()
+        restored_image.save(output_buffer, format="PNG", optimize=True)
+        output_buffer.seek(0)
     
     # Retourner l'image
     return StreamingResponse(
         output_buffer,
         media_type="image/png",
         headers={
-            "Content-Disposition": f"inline; filename=restored_{file.filename.rsplit('.', 1)[0]}.png"
+            "Content-Disposition": f"inline; filename=restored_{stem}.png",
+            **timing_headers(timer, profile_id)
         }
     )
 
 
 @app.post("/restore-jpeg")
-async def restore_jpeg_endpoint(file: UploadFile = File(...), quality_output: int = 95, quality_input: int = 5):
+async def restore_jpeg_endpoint(file: UploadFile = File(...), quality_output: int = 95, quality_input: int = 5,
+                                x_profile: Optional[str] = Header(None)):
     """
     Endpoint alternatif qui retourne un JPEG (fichier plus léger).
     
@@ -252,6 +669,7 @@ async def restore_jpeg_endpoint(file: UploadFile = File(...), quality_output: in
         file: Fichier image uploadé
         quality_output: Qualité JPEG de sortie (1-100, défaut: 95)
         quality_input: Qualité JPEG estimée de l'input (5-30, défaut: 10)
+        x_profile: En-tête X-Profile: 1 pour profiler la requête par couche
     
     Returns:
         Image restaurée en JPEG
@@ -271,31 +689,246 @@ async def restore_jpeg_endpoint(file: UploadFile = File(...), quality_output: in
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=415, detail="Format non supporté")
     
-    contents = await file.read()
+    timer = metrics.StageTimer(device)
+    with timer.stage("read"):
+        contents = await file.read()
     if len(contents) > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail="Fichier trop volumineux")
     
     try:
         image = Image.open(io.BytesIO(contents))
-        restored_image = restore_image(model, image, device, quality=quality_input)
+        profile = profiling.should_profile(x_profile, PROFILE_SAMPLE_RATE)
+        restored_image, profile_id = await run_restoration(image, quality_input, timer, profile=profile)
         
         # Sauvegarder en JPEG
-        output_buffer = io.BytesIO()
-        restored_image.save(output_buffer, format="JPEG", quality=quality_output, optimize=True)
-        output_buffer.seek(0)
+        with timer.stage("encode"):
+            output_buffer = io.BytesIO()
+            restored_image.save(output_buffer, format="JPEG", quality=quality_output, optimize=True)
+            output_buffer.seek(0)
         
         return StreamingResponse(
             output_buffer,
             media_type="image/jpeg",
             headers={
-                "Content-Disposition": f"inline; filename=restored_{file.filename.rsplit('.', 1)[0]}.jpg"
+                "Content-Disposition": f"inline; filename=restored_{file.filename.rsplit('.', 1)[0]}.jpg",
+                **timing_headers(timer, profile_id)
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def stream_sequence(frames: Iterator[Tuple[str, bytes]], restorer: SequenceRestorer):
+    """
+    Générateur de la réponse /restore-sequence : archive ZIP des images
+    restaurées dans l'ordre, erreurs signalées au fil de l'eau, et
+    ``sequence.json`` (statistiques de réutilisation) en dernier.
+    
+    Les images sont extraites de l'archive une à une, au fil de la réponse.
+    """
+    writer = ZipStreamWriter()
+    errors = []
+    
+    for index in itertools.count():
+        try:
+            frame = await run_in_threadpool(next, frames, None)
+        except Exception as e:
+            # Entrée corrompue : l'itérateur est interrompu, la séquence s'arrête là
+            print(f"❌ Séquence illisible à l'image {index} : {e}")
+            errors.append({"index": index, "filename": None, "status_code": 400,
+                           "error": f"Séquence illisible : {str(e)}"})
+            yield writer.add(f"{index:05d}.error.json",
+                             json.dumps(errors[-1], ensure_ascii=False).encode("utf-8"), "application/json")
+            break
+        if frame is None:
+            break
+        name, data = frame
+        stem = Path(safe_filename(name, index)).stem
+        timer = metrics.StageTimer(device)
+        tiles_restored = restorer.stats["tiles_restored"]
+        tiles_total = restorer.stats["tiles_total"]
+        try:
+            image = Image.open(io.BytesIO(data))
+            async with admitted(image.width * image.height):
+                restored_image = await run_in_threadpool(restorer.restore_frame, image, timer)
+        except Exception as e:
+            status_code = e.status_code if isinstance(e, HTTPException) else 500
+            detail = e.detail if isinstance(e, HTTPException) else f"Erreur lors de la restauration : {str(e)}"
+            print(f"❌ Image {name} : {detail}")
+            errors.append({"index": index, "filename": name, "status_code": status_code, "error": detail})
+            yield writer.add(f"{index:05d}_{stem}.error.json",
+                             json.dumps(errors[-1], ensure_ascii=False).encode("utf-8"), "application/json")
+            continue
+        
+        restored = restorer.stats["tiles_restored"] - tiles_restored
+        metrics.SEQUENCE_TILES.labels(outcome="restored").inc(restored)
+        metrics.SEQUENCE_TILES.labels(outcome="reused").inc(restorer.stats["tiles_total"] - tiles_total - restored)
+        metrics.PIXELS_PROCESSED.inc(image.width * image.height)
+        
+        with timer.stage("encode"):
+            output_buffer = io.BytesIO()
+            restored_image.save(output_buffer, format="PNG", optimize=True)
+        yield writer.add(f"{index:05d}_restored_{stem}.png", output_buffer.getvalue(), "image/png")
+    
+    summary = {**restorer.stats, "reuse_ratio": restorer.reuse_ratio, "errors": errors}
+    yield writer.add("sequence.json", json.dumps(summary, ensure_ascii=False, indent=2).encode("utf-8"),
+                     "application/json")
+    yield writer.close()
+
+
+@app.post("/restore-batch")
+async def restore_batch_endpoint(files: List[UploadFile] = File(...), quality: int = 5,
+                                 response_format: str = "zip"):
+    """
+    Restaure plusieurs images en une seule requête.
+    
+    Les images de même taille (une fois paddées) sont restaurées ensemble
+    par forwards batchés. La réponse est envoyée en streaming : chaque
+    image restaurée est transmise dès que son lot est terminé.
+    
+    Args:
+        files: Fichiers images uploadés (JPEG, PNG, WebP)
+        quality: Qualité JPEG estimée (5-30) pour le conditioning
+        response_format: "zip" (défaut) ou "multipart" (multipart/mixed)
+    
+    Returns:
+        Archive ZIP ou réponse multipart contenant les PNG restaurés,
+        un fichier .error.json par image en échec et un manifest.json
+    """
+    if model is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Le modèle n'est pas chargé. Vérifiez que '{MODEL_PATH}' existe."
+        )
+    
+    if response_format not in STREAM_WRITERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format de réponse inconnu. Formats acceptés : {', '.join(STREAM_WRITERS)}"
+        )
+    
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop de fichiers. Maximum : {MAX_BATCH_FILES} par requête"
+        )
+    
+    quality = max(5, min(30, quality))
+    
+    # Lecture et validation de chaque fichier : une erreur n'invalide pas le lot
+    items = []
+    for index, file in enumerate(files):
+        item = BatchItem(index=index, filename=safe_filename(file.filename, index))
+        items.append(item)
+        
+        if Path(item.filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+            item.error, item.status_code = "Format de fichier non supporté", 415
+            continue
+        
+        contents = await file.read()
+        if len(contents) > MAX_FILE_SIZE:
+            item.error, item.status_code = "Fichier trop volumineux", 413
+            continue
+        
+        try:
+            item.image = Image.open(io.BytesIO(contents))
+        except Exception as e:
+            item.error, item.status_code = f"Impossible de décoder l'image : {str(e)}", 400
+            continue
+        
+        if item.image.size[0] == 0 or item.image.size[1] == 0:
+            item.image = None
+            item.error, item.status_code = "L'image est vide ou invalide", 400
+    
+    print(f"📚 Lot reçu : {len(items)} fichier(s), Q={quality}")
+    
+    writer = STREAM_WRITERS[response_format]()
+    extension = "zip" if response_format == "zip" else "multipart"
+    return StreamingResponse(
+        stream_batch(items, quality, writer),
+        media_type=writer.media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=restored_batch.{extension}"
+        }
+    )
+
+
+@app.post("/restore-sequence")
+async def restore_sequence_endpoint(file: UploadFile = File(...), quality: int = 5, threshold: int = 0,
+                                    bit_exact: bool = True, tile_size: int = 128):
+    """
+    Restaure une séquence d'images (captures d'écran, vidéosurveillance).
+    
+    Seules les tuiles modifiées depuis l'image précédente repassent dans
+    le modèle ; les zones statiques réutilisent le résultat précédent.
+    
+    Args:
+        file: Archive ZIP d'images (triées par nom) ou flux MJPEG (.mjpeg, .mjpg)
+        quality: Qualité JPEG estimée (5-30) pour le conditioning
+        threshold: Écart maximal par pixel (0-255) pour réutiliser une tuile (0 = identique)
+        bit_exact: Recopier à l'identique les tuiles inchangées (sinon, appliquer le delta précédent)
+        tile_size: Taille des tuiles comparées (multiple de 16)
+    
+    Returns:
+        Archive ZIP des images restaurées (streaming) et sequence.json
+    """
+    if model is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Le modèle n'est pas chargé. Vérifiez que '{MODEL_PATH}' existe."
+        )
+    
+    if Path(file.filename).suffix.lower() not in SEQUENCE_EXTENSIONS:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Format de séquence non supporté. Formats acceptés : {', '.join(SEQUENCE_EXTENSIONS)}"
+        )
+    
+    if tile_size <= 0 or tile_size % 16 != 0:
+        raise HTTPException(status_code=400, detail="tile_size doit être un multiple de 16")
+    
+    contents = await file.read()
+    if len(contents) > MAX_SEQUENCE_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Fichier trop volumineux. Taille maximale : {MAX_SEQUENCE_FILE_SIZE // (1024*1024)} MB"
+        )
+    
+    # Limites vérifiées sur les tailles déclarées, avant toute décompression
+    try:
+        frame_count = scan_sequence(contents, file.filename, MAX_SEQUENCE_FRAMES, MAX_FILE_SIZE,
+                                    MAX_SEQUENCE_UNCOMPRESSED_SIZE)
+    except SequenceLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Séquence illisible : {str(e)}")
+    
+    if frame_count == 0:
+        raise HTTPException(status_code=400, detail="La séquence ne contient aucune image")
+    
+    restorer = SequenceRestorer(
+        model, device,
+        quality=max(5, min(30, quality)),
+        tile_size=tile_size,
+        threshold=max(0, min(255, threshold)),
+        bit_exact=bit_exact,
+        max_batch_size=BATCH_MAX_SIZE,
+        bucket_policy=bucket_policy,
+    )
+    print(f"🎞️  Séquence reçue : {frame_count} image(s) ({file.filename})")
+    
+    return StreamingResponse(
+        stream_sequence(iter_sequence_frames(contents, file.filename), restorer),
+        media_type=ZipStreamWriter.media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=restored_{Path(file.filename).stem}.zip"
+        }
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,201 @@
+"""
+Instrumentation Prometheus de l'API : latences par étape, charge et mémoire.
+Les métriques sont exposées au format texte Prometheus sur l'endpoint /metrics.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import torch
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+
+# Buckets adaptés aux étapes du pipeline (de la milliseconde à la minute)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(0, 16))  # 1 MB -> 32 GB
+RSS_SAMPLE_INTERVAL = 0.01  # Période d'échantillonnage du RSS sur CPU (secondes)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+STAGE_LATENCY = Histogram(
+    "unblurai_stage_duration_seconds",
+    "Durée de chaque étape du pipeline de restauration",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_LATENCY = Histogram(
+    "unblurai_request_duration_seconds",
+    "Durée totale des requêtes de restauration",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_TOTAL = Counter(
+    "unblurai_requests_total",
+    "Nombre de requêtes de restauration par code de statut",
+    ["endpoint", "status"],
+)
+QUEUE_DEPTH = Gauge(
+    "unblurai_queue_depth",
+    "Nombre de requêtes en attente du modèle",
+)
+IN_FLIGHT = Gauge(
+    "unblurai_requests_in_flight",
+    "Nombre de requêtes de restauration en cours",
+)
+PIXELS_IN_FLIGHT = Gauge(
+    "unblurai_pixels_in_flight",
+    "Pixels décodés en cours de traitement (budget d'admission consommé)",
+)
+ADMISSIONS_TOTAL = Counter(
+    "unblurai_admissions_total",
+    "Décisions du contrôleur d'admission par voie (admitted, shed, too_large)",
+    ["lane", "outcome"],
+)
+PIXELS_PROCESSED = Counter(
+    "unblurai_pixels_processed_total",
+    "Nombre total de pixels restaurés",
+)
+INFERENCES_TOTAL = Counter(
+    "unblurai_inferences_total",
+    "Nombre d'inférences par mode (single ou tiled)",
+    ["mode"],
+)
+SEQUENCE_TILES = Counter(
+    "unblurai_sequence_tiles_total",
+    "Tuiles des séquences restaurées par le modèle ou réutilisées",
+    ["outcome"],
+)
+BUCKET_REQUESTS = Counter(
+    "unblurai_bucket_requests_total",
+    "Entrées paddées par forme (bucket HxW)",
+    ["bucket"],
+)
+PADDED_PIXELS = Counter(
+    "unblurai_padded_pixels_total",
+    "Pixels envoyés au modèle : pixels de l'image ou de padding",
+    ["kind"],
+)
+PEAK_MEMORY = Histogram(
+    "unblurai_request_peak_memory_bytes",
+    "Pic mémoire d'une restauration (allocation CUDA, ou hausse du RSS sur CPU)",
+    ["device"],
+    buckets=MEMORY_BUCKETS,
+)
+
+
+class StageTimer:
+    """
+    Chronomètre les étapes d'une requête.
+
+    Chaque étape est observée dans l'histogramme Prometheus et cumulée
+    localement pour construire l'en-tête Server-Timing de la réponse.
+    """
+
+    def __init__(self, device: Optional[torch.device] = None):
+        self.device = device
+        self.durations: Dict[str, float] = {}
+
+    def _synchronize(self):
+        # Les kernels CUDA sont asynchrones : synchroniser pour mesurer le vrai temps
+        if self.device is not None and self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    @contextmanager
+    def stage(self, name: str):
+        self._synchronize()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._synchronize()
+            elapsed = time.perf_counter() - start
+            STAGE_LATENCY.labels(stage=name).observe(elapsed)
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def server_timing(self) -> str:
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes)."""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()
+        )
+
+
+def _current_rss() -> Optional[int]:
+    """RSS courant du processus en octets (/proc/self/statm, Linux uniquement)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _RssSampler:
+    """Échantillonne le RSS courant dans un thread pendant une restauration."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.baseline = _current_rss()
+        self.peak = self.baseline
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        if self.baseline is not None:
+            self._thread.start()
+
+    def _run(self, interval: float):
+        while not self._done.wait(interval):
+            rss = _current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self) -> Optional[int]:
+        """Arrête l'échantillonnage et retourne l'augmentation maximale du RSS (octets)."""
+        if self.baseline is None:
+            return None
+        self._done.set()
+        self._thread.join()
+        return max(self.peak, _current_rss() or 0) - self.baseline
+
+
+@contextmanager
+def track_peak_memory(device: torch.device):
+    """
+    Enregistre le pic mémoire d'une restauration.
+
+    Sur GPU, le pic d'allocation CUDA est remis à zéro pour chaque requête.
+    Sur CPU, le RSS courant est échantillonné pendant la requête et on
+    observe son maximum moins la valeur de départ. Les requêtes simultanées
+    partagent le processus : la valeur inclut leurs allocations.
+    Sans /proc (macOS, Windows), rien n'est observé sur CPU.
+    """
+    sampler = None
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+    else:
+        sampler = _RssSampler()
+    try:
+        yield
+    finally:
+        if device.type == 'cuda':
+            peak = torch.cuda.max_memory_allocated(device)
+        else:
+            peak = sampler.stop()
+        if peak is not None:
+            PEAK_MEMORY.labels(device=device.type).observe(peak)
+
+
+def record_inference(mode: str, width: int, height: int):
+    """Compte une inférence terminée et les pixels traités."""
+    INFERENCES_TOTAL.labels(mode=mode).inc()
+    PIXELS_PROCESSED.inc(width * height)
+
+
+def observe_bucket(bucket: str, image_pixels: int, padded_pixels: int):
+    """Listener de BucketPolicy : réutilisation des buckets et calcul perdu dans le padding."""
+    BUCKET_REQUESTS.labels(bucket=bucket).inc()
+    PADDED_PIXELS.labels(kind="image").inc(image_pixels)
+    PADDED_PIXELS.labels(kind="padding").inc(padded_pixels - image_pixels)
+
+
+def render_metrics():
+    """Retourne (contenu, content-type) pour l'endpoint /metrics."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -8,14 +8,33 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 
+# Largeurs (nombre de canaux) de chaque groupe de l'architecture d'origine.
+# Les clés ".res" désignent la largeur interne d'un ResidualBlock
+# (sortie de conv1/bn1), indépendante de sa largeur d'entrée/sortie.
+DEFAULT_WIDTHS = {
+    "enc1": 64, "enc1.res": 64,
+    "enc2": 128, "enc2.res": 128,
+    "enc3": 256, "enc3.res": 256,
+    "enc4": 512, "enc4.res": 512,
+    "bottleneck": 1024, "bottleneck.res1": 1024, "bottleneck.res2": 1024,
+    "dec4": 512, "dec4.res": 512,
+    "dec3": 256, "dec3.res": 256,
+    "dec2": 128, "dec2.res": 128,
+    "dec1": 64, "dec1.res": 64,
+    "reduce4": 512, "reduce3": 256, "reduce2": 128, "reduce1": 64,
+    "final": 64,
+}
+
+
 class ResidualBlock(nn.Module):
     """Bloc résiduel avec convolutions 3x3"""
     
-    def __init__(self, channels):
+    def __init__(self, channels, mid_channels=None):
         super(ResidualBlock, self).__init__()
-        self.conv1 = nn.Conv2d(channels, channels, kernel_size=3, padding=1)
-        self.bn1 = nn.BatchNorm2d(channels)
-        self.conv2 = nn.Conv2d(channels, channels, kernel_size=3, padding=1)
+        mid_channels = mid_channels or channels
+        self.conv1 = nn.Conv2d(channels, mid_channels, kernel_size=3, padding=1)
+        self.bn1 = nn.BatchNorm2d(mid_channels)
+        self.conv2 = nn.Conv2d(mid_channels, channels, kernel_size=3, padding=1)
         self.bn2 = nn.BatchNorm2d(channels)
         self.relu = nn.ReLU(inplace=True)
     
@@ -41,73 +60,87 @@ class UNet(nn.Module):
     
     Entrée : Image normalisée [-1, 1], 4 canaux (RGB + Q/100)
     Sortie : Delta résiduel [-1, 1], 3 canaux (RGB)
+    
+    Les largeurs de chaque groupe de canaux sont configurables (``widths``,
+    voir DEFAULT_WIDTHS) pour charger des variantes élaguées ; les noms des
+    couches, et donc les clés du state_dict, restent identiques.
     """
     
-    def __init__(self, in_channels=4, out_channels=3):
+    def __init__(self, in_channels=4, out_channels=3, widths=None):
         super(UNet, self).__init__()
         self.n_channels = in_channels
         self.n_classes = out_channels
+        self.widths = {**DEFAULT_WIDTHS, **(widths or {})}
+        w = self.widths
 
         # Encodeurs (downsampling)
-        self.enc1 = self._encoder_block(in_channels, 64)
-        self.enc2 = self._encoder_block(64, 128)
-        self.enc3 = self._encoder_block(128, 256)
-        self.enc4 = self._encoder_block(256, 512)
+        self.enc1 = self._encoder_block(in_channels, w["enc1"], w["enc1.res"])
+        self.enc2 = self._encoder_block(w["enc1"], w["enc2"], w["enc2.res"])
+        self.enc3 = self._encoder_block(w["enc2"], w["enc3"], w["enc3.res"])
+        self.enc4 = self._encoder_block(w["enc3"], w["enc4"], w["enc4.res"])
 
         # Bottleneck avec convolutions dilatées
         self.bottleneck = nn.Sequential(
-            nn.Conv2d(512, 1024, 3, padding=2, dilation=2),
-            nn.BatchNorm2d(1024),
+            nn.Conv2d(w["enc4"], w["bottleneck"], 3, padding=2, dilation=2),
+            nn.BatchNorm2d(w["bottleneck"]),
             nn.ReLU(inplace=True),
-            ResidualBlock(1024),
-            ResidualBlock(1024),
+            ResidualBlock(w["bottleneck"], w["bottleneck.res1"]),
+            ResidualBlock(w["bottleneck"], w["bottleneck.res2"]),
             nn.Dropout2d(0.5)
         )
 
         # Décodeurs (upsampling)
-        self.dec4 = self._decoder_block(1024, 512)
-        self.dec3 = self._decoder_block(512, 256)
-        self.dec2 = self._decoder_block(256, 128)
-        self.dec1 = self._decoder_block(128, 64)
+        self.dec4 = self._decoder_block(w["bottleneck"], w["dec4"], w["dec4.res"])
+        self.dec3 = self._decoder_block(w["reduce4"], w["dec3"], w["dec3.res"])
+        self.dec2 = self._decoder_block(w["reduce3"], w["dec2"], w["dec2.res"])
+        self.dec1 = self._decoder_block(w["reduce2"], w["dec1"], w["dec1.res"])
 
         # Couches de réduction pour les skip connections
-        self.reduce4 = nn.Conv2d(1024, 512, 1)
-        self.reduce3 = nn.Conv2d(512, 256, 1)
-        self.reduce2 = nn.Conv2d(256, 128, 1)
-        self.reduce1 = nn.Conv2d(128, 64, 1)
+        self.reduce4 = nn.Conv2d(w["dec4"] + w["enc4"], w["reduce4"], 1)
+        self.reduce3 = nn.Conv2d(w["dec3"] + w["enc3"], w["reduce3"], 1)
+        self.reduce2 = nn.Conv2d(w["dec2"] + w["enc2"], w["reduce2"], 1)
+        self.reduce1 = nn.Conv2d(w["dec1"] + w["enc1"], w["reduce1"], 1)
 
         # 🆕 Couche de sortie RÉSIDUELLE (Tanh pour delta [-1, 1])
         self.final = nn.Sequential(
-            nn.Conv2d(64, 64, 3, padding=1),
-            nn.BatchNorm2d(64),
+            nn.Conv2d(w["reduce1"], w["final"], 3, padding=1),
+            nn.BatchNorm2d(w["final"]),
             nn.ReLU(inplace=True),
-            nn.Conv2d(64, out_channels, 1),
+            nn.Conv2d(w["final"], out_channels, 1),
             nn.Tanh()  # Delta dans [-1, 1]
         )
 
         self.pool = nn.MaxPool2d(2)
         self.upsample = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
 
-    def _encoder_block(self, in_ch, out_ch):
+    def _encoder_block(self, in_ch, out_ch, mid_ch=None):
         """Bloc d'encodeur avec convolution, BatchNorm, ReLU, ResidualBlock et Dropout"""
         return nn.Sequential(
             nn.Conv2d(in_ch, out_ch, 3, padding=1),
             nn.BatchNorm2d(out_ch),
             nn.ReLU(inplace=True),
-            ResidualBlock(out_ch),
+            ResidualBlock(out_ch, mid_ch),
             nn.Dropout2d(0.1)
         )
 
-    def _decoder_block(self, in_ch, out_ch):
+    def _decoder_block(self, in_ch, out_ch, mid_ch=None):
         """Bloc de décodeur avec convolution, BatchNorm, ReLU, ResidualBlock et Dropout"""
         return nn.Sequential(
             nn.Conv2d(in_ch, out_ch, 3, padding=1),
             nn.BatchNorm2d(out_ch),
             nn.ReLU(inplace=True),
-            ResidualBlock(out_ch),
+            ResidualBlock(out_ch, mid_ch),
             nn.Dropout2d(0.1)
         )
 
+    def config(self) -> dict:
+        """Configuration d'architecture à embarquer dans un checkpoint (clé 'model_config')."""
+        return {
+            "in_channels": self.n_channels,
+            "out_channels": self.n_classes,
+            "widths": dict(self.widths),
+        }
+
     def _align_tensors(self, dec, enc):
         """
         Aligne les tenseurs décodeur et encodeur avec padding si nécessaire.
@@ -173,6 +206,10 @@ def load_model(model_path: str, device: torch.device) -> UNet:
     - in_channels=4 (RGB + Q/100)
     - Sortie résiduelle (delta)
     
+    Si le checkpoint embarque sa configuration d'architecture (clé
+    'model_config', écrite par prune.py), le U-Net est construit avec ces
+    largeurs ; sinon l'architecture d'origine est utilisée.
+    
     Args:
         model_path: Chemin vers le fichier .pth
         device: Device PyTorch (cuda ou cpu)
@@ -180,11 +217,15 @@ def load_model(model_path: str, device: torch.device) -> UNet:
     Returns:
         Modèle U-Net chargé en mode eval
     """
-    model = UNet(in_channels=4, out_channels=3)  # 🆕 4 canaux d'entrée
-    
     # Charger le checkpoint
     checkpoint = torch.load(model_path, map_location=device)
     
+    config = checkpoint.get('model_config') if isinstance(checkpoint, dict) else None
+    if config:
+        model = UNet(**config)
+    else:
+        model = UNet(in_channels=4, out_channels=3)  # 🆕 4 canaux d'entrée
+    
     # Vérifier si c'est un checkpoint complet ou juste un state_dict
     if isinstance(checkpoint, dict):
         if 'model_state_dict' in checkpoint:
@@ -0,0 +1,199 @@
+"""
+Profilage par couche du U-Net (opt-in).
+
+Des forward hooks sont posés sur les sous-modules du modèle uniquement
+pendant une requête profilée, puis retirés : aucun coût quand le profilage
+est désactivé. Les profils récents sont conservés en mémoire et exportables
+au format Chrome Trace (chrome://tracing, Perfetto).
+"""
+
+import time
+import uuid
+import random
+import threading
+from collections import deque, OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+
+MAX_STORED_PROFILES = 50
+
+
+def _tensor_bytes(output) -> int:
+    """Taille en octets du (ou des) tenseur(s) de sortie d'un module."""
+    if isinstance(output, torch.Tensor):
+        return output.numel() * output.element_size()
+    if isinstance(output, (tuple, list)):
+        return sum(_tensor_bytes(o) for o in output)
+    return 0
+
+
+class LayerProfiler:
+    """
+    Mesure le temps et la taille de sortie de chaque bloc du modèle.
+
+    Les blocs profilés sont les enfants directs du U-Net (enc1..enc4,
+    bottleneck, dec4..dec1, reduce4..reduce1, final, pool, upsample) ainsi
+    que le modèle complet (``UNet``). Un module appelé plusieurs fois
+    (pool, upsample, ou un forward par tuile) produit un événement par appel.
+    """
+
+    def __init__(self, model: nn.Module, device: torch.device):
+        self.model = model
+        self.device = device
+        self.events: List[Dict] = []
+        self._handles = []
+        self._starts: Dict[int, List[float]] = {}
+        self._thread_id = None
+        self._origin = 0.0
+
+    def _synchronize(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    def _modules(self) -> List[Tuple[str, nn.Module]]:
+        return [(type(self.model).__name__, self.model)] + list(self.model.named_children())
+
+    def _make_hooks(self, name: str, module: nn.Module):
+        key = id(module)
+
+        def pre_hook(mod, inputs):
+            # Ignorer les forwards d'autres requêtes exécutées en parallèle
+            if threading.get_ident() != self._thread_id:
+                return
+            self._synchronize()
+            self._starts.setdefault(key, []).append(time.perf_counter())
+
+        def post_hook(mod, inputs, output):
+            if threading.get_ident() != self._thread_id or not self._starts.get(key):
+                return
+            self._synchronize()
+            end = time.perf_counter()
+            start = self._starts[key].pop()
+            self.events.append({
+                "block": name,
+                "start_ms": (start - self._origin) * 1000,
+                "duration_ms": (end - start) * 1000,
+                "output_bytes": _tensor_bytes(output),
+                "input_shape": list(inputs[0].shape) if inputs and isinstance(inputs[0], torch.Tensor) else None,
+            })
+
+        return pre_hook, post_hook
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        self._origin = time.perf_counter()
+        for name, module in self._modules():
+            pre_hook, post_hook = self._make_hooks(name, module)
+            self._handles.append(module.register_forward_pre_hook(pre_hook))
+            self._handles.append(module.register_forward_hook(post_hook))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        return False
+
+    def summary(self) -> List[Dict]:
+        """Agrège les événements par bloc, triés par temps total décroissant."""
+        blocks: "OrderedDict[str, Dict]" = OrderedDict()
+        for event in self.events:
+            block = blocks.setdefault(event["block"], {
+                "block": event["block"],
+                "calls": 0,
+                "total_ms": 0.0,
+                "output_bytes": 0,
+            })
+            block["calls"] += 1
+            block["total_ms"] += event["duration_ms"]
+            block["output_bytes"] += event["output_bytes"]
+        return sorted(blocks.values(), key=lambda b: b["total_ms"], reverse=True)
+
+
+class ProfileStore:
+    """Conserve les derniers profils (FIFO borné), accessibles par identifiant."""
+
+    def __init__(self, max_profiles: int = MAX_STORED_PROFILES):
+        self._profiles: deque = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def add(self, profiler: LayerProfiler, metadata: Dict) -> str:
+        profile_id = uuid.uuid4().hex[:12]
+        record = {
+            "id": profile_id,
+            "created_at": time.time(),
+            **metadata,
+            "summary": profiler.summary(),
+            "events": profiler.events,
+        }
+        with self._lock:
+            self._profiles.append(record)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        with self._lock:
+            for record in self._profiles:
+                if record["id"] == profile_id:
+                    return record
+        return None
+
+    def list(self) -> List[Dict]:
+        """Liste des profils sans le détail des événements (le plus récent d'abord)."""
+        with self._lock:
+            records = list(self._profiles)
+        return [
+            {key: value for key, value in record.items() if key != "events"}
+            for record in reversed(records)
+        ]
+
+
+def to_chrome_trace(record: Dict) -> Dict:
+    """
+    Convertit un profil au format Chrome Trace Event (événements complets "X",
+    timestamps en microsecondes).
+    """
+    return {
+        "traceEvents": [
+            {
+                "name": event["block"],
+                "cat": "unet",
+                "ph": "X",
+                "ts": event["start_ms"] * 1000,
+                "dur": event["duration_ms"] * 1000,
+                "pid": 0,
+                "tid": 0,
+                "args": {
+                    "input_shape": event["input_shape"],
+                    "output_bytes": event["output_bytes"],
+                },
+            }
+            for event in record["events"]
+        ],
+        "displayTimeUnit": "ms",
+        "metadata": {key: value for key, value in record.items() if key not in ("events", "summary")},
+    }
+
+
+def should_profile(header_value: Optional[str], sample_rate: float) -> bool:
+    """
+    Décide si une requête doit être profilée : en-tête explicite
+    (``X-Profile: 1``) ou échantillonnage global à ``sample_rate`` (0-1).
+    """
+    if header_value is not None and header_value.lower() in ("1", "true", "yes"):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def profile_call(model: nn.Module, device: torch.device, fn: Callable, *args, **kwargs):
+    """
+    Exécute ``fn(*args, **kwargs)`` avec les hooks de profilage posés sur ``model``.
+
+    Returns:
+        Tuple (résultat de fn, LayerProfiler)
+    """
+    with LayerProfiler(model, device) as profiler:
+        result = fn(*args, **kwargs)
+    return result, profiler
@@ -0,0 +1,355 @@
+"""
+Élagage structuré des canaux du U-Net.
+
+Les filtres de chaque groupe de canaux sont classés (gamma de BatchNorm ou
+norme L1 des filtres), puis les moins importants sont retirés de façon
+cohérente dans toutes les couches qui partagent ce groupe : skip connections
+encodeur/décodeur, additions des ResidualBlock et couches reduceN. Le
+checkpoint produit embarque sa configuration d'architecture et se charge
+directement avec load_model.
+
+Usage :
+    python prune.py models/best_model.pth models/pruned_50.pth --ratio 0.5
+    python prune.py models/best_model.pth models/pruned_50.pth --ratio 0.5 --calibrate 20 --finetune-steps 500
+"""
+
+import io
+import os
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image, ImageDraw, ImageFilter
+
+from model import UNet, load_model
+
+
+CRITERIA = ("bn", "l1")
+MIN_CHANNELS = 8
+CHANNEL_MULTIPLE = 8  # Largeurs arrondies pour rester efficaces sur CPU/GPU
+
+
+def layer_specs() -> List[Tuple[str, str, str, Optional[List[str]]]]:
+    """
+    Décrit le rôle de chaque couche dans les groupes de canaux.
+
+    Returns:
+        Liste de (type, nom du module, groupe de sortie, groupes d'entrée).
+        Type "conv" : les groupes d'entrée sont concaténés dans l'ordre ;
+        type "bn" : les paramètres suivent le groupe de sortie.
+        Les groupes "input" et "output" ne sont jamais élagués.
+    """
+    specs = []
+
+    def residual(prefix: str, group: str, res_group: str):
+        specs.extend([
+            ("conv", f"{prefix}.conv1", res_group, [group]),
+            ("bn", f"{prefix}.bn1", res_group, None),
+            ("conv", f"{prefix}.conv2", group, [res_group]),
+            ("bn", f"{prefix}.bn2", group, None),
+        ])
+
+    previous = "input"
+    for k in range(1, 5):
+        group = f"enc{k}"
+        specs.extend([("conv", f"{group}.0", group, [previous]), ("bn", f"{group}.1", group, None)])
+        residual(f"{group}.3", group, f"{group}.res")
+        previous = group
+
+    specs.extend([("conv", "bottleneck.0", "bottleneck", ["enc4"]), ("bn", "bottleneck.1", "bottleneck", None)])
+    residual("bottleneck.3", "bottleneck", "bottleneck.res1")
+    residual("bottleneck.4", "bottleneck", "bottleneck.res2")
+    previous = "bottleneck"
+
+    for k in range(4, 0, -1):
+        group = f"dec{k}"
+        specs.extend([("conv", f"{group}.0", group, [previous]), ("bn", f"{group}.1", group, None)])
+        residual(f"{group}.3", group, f"{group}.res")
+        # Skip connection : torch.cat([dec, enc]) puis conv 1x1
+        specs.append(("conv", f"reduce{k}", f"reduce{k}", [group, f"enc{k}"]))
+        previous = f"reduce{k}"
+
+    specs.extend([
+        ("conv", "final.0", "final", [previous]),
+        ("bn", "final.1", "final", None),
+        ("conv", "final.3", "output", ["final"]),
+    ])
+    return specs
+
+
+def group_importance(model: UNet, criterion: str = "bn") -> Dict[str, torch.Tensor]:
+    """
+    Score d'importance de chaque canal, par groupe.
+
+    - "bn" : |gamma| des BatchNorm qui normalisent le groupe ; les groupes
+      sans BatchNorm (reduceN) retombent sur la norme L1.
+    - "l1" : norme L1 des filtres des convolutions qui produisent le groupe.
+
+    Quand plusieurs couches alimentent un même groupe (addition résiduelle),
+    leurs scores sont normalisés par leur moyenne puis additionnés.
+    """
+    state = model.state_dict()
+    bn_scores: Dict[str, List[torch.Tensor]] = {}
+    l1_scores: Dict[str, List[torch.Tensor]] = {}
+    for kind, name, group, _ in layer_specs():
+        if group == "output":
+            continue
+        if kind == "bn":
+            score = state[f"{name}.weight"].detach().abs().float()
+            bn_scores.setdefault(group, []).append(score / (score.mean() + 1e-12))
+        else:
+            weight = state[f"{name}.weight"].detach().float()
+            score = weight.abs().flatten(1).sum(dim=1)
+            l1_scores.setdefault(group, []).append(score / (score.mean() + 1e-12))
+
+    scores = {}
+    for group in l1_scores:
+        source = bn_scores if criterion == "bn" and group in bn_scores else l1_scores
+        scores[group] = torch.stack(source[group]).sum(dim=0)
+    return scores
+
+
+def _kept_width(width: int, ratio: float) -> int:
+    kept = int(round(width * (1 - ratio) / CHANNEL_MULTIPLE)) * CHANNEL_MULTIPLE
+    return max(MIN_CHANNELS, min(width, kept))
+
+
+def prune_model(model: UNet, ratio: float, criterion: str = "bn") -> UNet:
+    """
+    Retire ``ratio`` des canaux de chaque groupe et retourne un nouveau U-Net
+    plus étroit dont les poids sont copiés depuis ``model``.
+
+    Args:
+        model: U-Net d'origine (non modifié)
+        ratio: Fraction des canaux à retirer (0-1)
+        criterion: "bn" (gamma de BatchNorm) ou "l1" (norme des filtres)
+
+    Returns:
+        U-Net élagué, sur le même device, en mode eval
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Critère inconnu : {criterion} (attendu : {', '.join(CRITERIA)})")
+    if not 0 <= ratio < 1:
+        raise ValueError("ratio doit être dans [0, 1)")
+
+    widths = model.widths
+    keep: Dict[str, torch.Tensor] = {
+        "input": torch.arange(model.n_channels),
+        "output": torch.arange(model.n_classes),
+    }
+    for group, scores in group_importance(model, criterion).items():
+        n_keep = _kept_width(widths[group], ratio)
+        keep[group] = torch.sort(torch.topk(scores, n_keep).indices).values.cpu()
+
+    new_widths = {group: len(keep[group]) for group in widths}
+    original_widths = {**widths, "input": model.n_channels, "output": model.n_classes}
+
+    state = model.state_dict()
+    new_state = {}
+    for kind, name, group, in_groups in layer_specs():
+        out_idx = keep[group]
+        if kind == "bn":
+            for param in ("weight", "bias", "running_mean", "running_var"):
+                new_state[f"{name}.{param}"] = state[f"{name}.{param}"][out_idx].clone()
+            new_state[f"{name}.num_batches_tracked"] = state[f"{name}.num_batches_tracked"].clone()
+            continue
+
+        # Indices d'entrée : groupes concaténés, décalés de la largeur d'origine
+        in_idx, offset = [], 0
+        for in_group in in_groups:
+            in_idx.append(keep[in_group] + offset)
+            offset += original_widths[in_group]
+        in_idx = torch.cat(in_idx)
+
+        new_state[f"{name}.weight"] = state[f"{name}.weight"][out_idx][:, in_idx].clone()
+        new_state[f"{name}.bias"] = state[f"{name}.bias"][out_idx].clone()
+
+    device = next(model.parameters()).device
+    pruned = UNet(in_channels=model.n_channels, out_channels=model.n_classes, widths=new_widths)
+    pruned.load_state_dict(new_state)
+    return pruned.to(device).eval()
+
+
+def count_parameters(model: torch.nn.Module) -> int:
+    return sum(p.numel() for p in model.parameters())
+
+
+def checkpoint_size(model: UNet) -> int:
+    """Taille en octets du checkpoint sérialisé."""
+    buffer = io.BytesIO()
+    torch.save({"model_state_dict": model.state_dict(), "model_config": model.config()}, buffer)
+    return buffer.tell()
+
+
+# ---------------------------------------------------------------------------
+# Données synthétiques (calibration, fine-tuning, évaluation)
+# ---------------------------------------------------------------------------
+
+def synthetic_image(size: int, rng: np.random.Generator) -> Image.Image:
+    """
+    Image synthétique : dégradé de fond, formes pleines, traits fins et
+    texture bruitée, pour exercer contours et zones lisses.
+    """
+    x = np.linspace(0, 1, size, dtype=np.float32)
+    start, end = rng.uniform(0, 255, 3), rng.uniform(0, 255, 3)
+    angle = rng.uniform(0, np.pi)
+    ramp = np.clip(np.cos(angle) * x[None, :] + np.sin(angle) * x[:, None], 0, 1)[..., None]
+    background = start * (1 - ramp) + end * ramp
+    image = Image.fromarray(background.astype(np.uint8), mode='RGB')
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.integers(3, 9)):
+        box = sorted(rng.integers(0, size, 2).tolist()) + sorted(rng.integers(0, size, 2).tolist())
+        box = [box[0], box[2], box[1], box[3]]
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            draw.rectangle(box, fill=color)
+        else:
+            draw.ellipse(box, fill=color)
+    for _ in range(rng.integers(2, 6)):
+        points = [tuple(int(v) for v in rng.integers(0, size, 2)) for _ in range(2)]
+        draw.line(points, fill=tuple(int(c) for c in rng.integers(0, 256, 3)), width=int(rng.integers(1, 4)))
+
+    texture = rng.normal(0, rng.uniform(2, 12), (size, size, 3))
+    image = np.clip(np.asarray(image, dtype=np.float32) + texture, 0, 255).astype(np.uint8)
+    return Image.fromarray(image, mode='RGB').filter(ImageFilter.GaussianBlur(rng.uniform(0, 0.8)))
+
+
+def synthetic_batch(batch_size: int, size: int, rng: np.random.Generator,
+                    quality_range: Tuple[int, int] = (5, 30)) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Paires (entrée JPEG + canal Q, cible propre) normalisées en [-1, 1],
+    avec le même pipeline que l'entraînement (compression Q aléatoire).
+
+    Returns:
+        Tuple (entrées (B, 4, H, W), cibles (B, 3, H, W))
+    """
+    inputs, targets = [], []
+    for _ in range(batch_size):
+        clean = synthetic_image(size, rng)
+        quality = int(rng.integers(quality_range[0], quality_range[1] + 1))
+        buffer = io.BytesIO()
+        clean.save(buffer, format="JPEG", quality=quality)
+        compressed = Image.open(io.BytesIO(buffer.getvalue())).convert('RGB')
+
+        to_tensor = lambda img: torch.from_numpy(np.asarray(img, dtype=np.float32) / 127.5 - 1).permute(2, 0, 1)
+        quality_channel = torch.full((1, size, size), quality / 100.0)
+        inputs.append(torch.cat([to_tensor(compressed), quality_channel]))
+        targets.append(to_tensor(clean))
+    return torch.stack(inputs), torch.stack(targets)
+
+
+def psnr(prediction: torch.Tensor, target: torch.Tensor) -> float:
+    """PSNR (dB) entre deux tenseurs en [-1, 1]."""
+    mse = F.mse_loss((prediction + 1) / 2, (target + 1) / 2).item()
+    return float("inf") if mse == 0 else 10 * np.log10(1.0 / mse)
+
+
+@torch.no_grad()
+def evaluate_psnr(model: UNet, batches: List[Tuple[torch.Tensor, torch.Tensor]],
+                  device: torch.device) -> Tuple[float, float]:
+    """
+    PSNR moyen avant (entrée JPEG) et après restauration.
+
+    Returns:
+        Tuple (PSNR entrée, PSNR restauré)
+    """
+    model.eval()
+    before, after = [], []
+    for inputs, targets in batches:
+        inputs, targets = inputs.to(device), targets.to(device)
+        restored = torch.clamp(inputs[:, :3] + model(inputs), -1, 1)
+        before.append(psnr(inputs[:, :3], targets))
+        after.append(psnr(restored, targets))
+    return float(np.mean(before)), float(np.mean(after))
+
+
+@torch.no_grad()
+def calibrate_batchnorm(model: UNet, steps: int, device: torch.device, batch_size: int = 4,
+                        size: int = 128, seed: int = 0):
+    """
+    Recalcule les statistiques des BatchNorm sur des données synthétiques :
+    après élagage, les moyennes/variances d'origine ne correspondent plus
+    aux activations du réseau réduit. Seules les BatchNorm passent en mode
+    entraînement : le Dropout reste inactif pour ne pas fausser les statistiques.
+    """
+    rng = np.random.default_rng(seed)
+    model.eval()
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.reset_running_stats()
+            module.momentum = None  # Moyenne cumulée sur toutes les étapes
+            module.train()
+    with torch.no_grad():
+        for _ in range(steps):
+            inputs, _ = synthetic_batch(batch_size, size, rng)
+            model(inputs.to(device))
+    model.eval()
+
+
+def finetune(model: UNet, steps: int, device: torch.device, batch_size: int = 4, size: int = 128,
+             lr: float = 1e-4, seed: int = 0):
+    """
+    Court fine-tuning sur données JPEG synthétiques (loss Charbonnier sur
+    l'image reconstruite input + delta, comme à l'entraînement).
+    """
+    rng = np.random.default_rng(seed)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    model.train()
+    for step in range(1, steps + 1):
+        inputs, targets = synthetic_batch(batch_size, size, rng)
+        inputs, targets = inputs.to(device), targets.to(device)
+        restored = inputs[:, :3] + model(inputs)
+        loss = torch.sqrt((restored - targets) ** 2 + 1e-6).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        if step % 50 == 0 or step == steps:
+            print(f"  étape {step}/{steps} - loss {loss.item():.4f}")
+    model.eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Élagage structuré des canaux du U-Net")
+    parser.add_argument("input", help="Checkpoint d'origine (.pth)")
+    parser.add_argument("output", help="Checkpoint élagué à écrire (.pth)")
+    parser.add_argument("--ratio", type=float, default=0.5, help="Fraction des canaux à retirer (0-1)")
+    parser.add_argument("--criterion", choices=CRITERIA, default="bn", help="Classement des filtres")
+    parser.add_argument("--calibrate", type=int, default=0, help="Étapes de recalibration des BatchNorm")
+    parser.add_argument("--finetune-steps", type=int, default=0, help="Étapes de fine-tuning synthétique")
+    parser.add_argument("--lr", type=float, default=1e-4, help="Learning rate du fine-tuning")
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = load_model(args.input, device)
+    pruned = prune_model(model, args.ratio, args.criterion)
+
+    print(f"✂️  Élagage {args.ratio:.0%} ({args.criterion}) : "
+          f"{count_parameters(model):,} -> {count_parameters(pruned):,} paramètres")
+
+    if args.calibrate > 0:
+        print(f"📏 Recalibration des BatchNorm ({args.calibrate} étapes)...")
+        calibrate_batchnorm(pruned, args.calibrate, device)
+    if args.finetune_steps > 0:
+        print(f"🎯 Fine-tuning synthétique ({args.finetune_steps} étapes)...")
+        finetune(pruned, args.finetune_steps, device, lr=args.lr)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    torch.save({
+        "model_state_dict": pruned.state_dict(),
+        "model_config": pruned.config(),
+        "pruning": {
+            "source": os.path.basename(args.input),
+            "ratio": args.ratio,
+            "criterion": args.criterion,
+            "calibration_steps": args.calibrate,
+            "finetune_steps": args.finetune_steps,
+        },
+    }, args.output)
+    print(f"✅ Checkpoint élagué écrit : {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
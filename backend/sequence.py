@@ -0,0 +1,366 @@
+"""
+Restauration de séquences d'images (captures d'écran, vidéosurveillance, MJPEG).
+
+Deux images consécutives d'une séquence sont souvent presque identiques :
+l'image est découpée en tuiles et seules les tuiles qui ont changé depuis
+leur dernière restauration repassent dans le modèle. Les autres réutilisent
+le résultat précédent.
+
+Usage :
+    python sequence.py frames/ restored/ --quality 10
+    python sequence.py capture.mjpeg restored.zip --threshold 2
+"""
+
+import io
+import os
+import sys
+import time
+import zipfile
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+from inference import infer_batch, padded_size, restore_image, correct_image_orientation, BucketPolicy
+
+
+SEQUENCE_EXTENSIONS = {".zip", ".mjpeg", ".mjpg"}
+FRAME_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+Box = Tuple[int, int, int, int]  # (top, left, bottom, right)
+
+
+class SequenceLimitExceeded(ValueError):
+    """Séquence hors limites (nombre d'images ou taille décompressée)."""
+
+
+def _mjpeg_bounds(data: bytes) -> Iterator[Tuple[int, int]]:
+    """Positions (début, fin) des images JPEG d'un flux MJPEG (marqueurs SOI/EOI)."""
+    position = 0
+    while True:
+        start = data.find(JPEG_SOI, position)
+        if start < 0:
+            return
+        end = data.find(JPEG_EOI, start + 2)
+        if end < 0:
+            return
+        yield start, end + 2
+        position = end + 2
+
+
+def iter_mjpeg_frames(data: bytes) -> Iterator[bytes]:
+    """
+    Découpe un flux MJPEG en images JPEG (marqueurs SOI/EOI).
+    Fonctionne aussi sur un flux multipart/x-mixed-replace : les en-têtes
+    entre deux images sont ignorés. Les JPEG contenant une miniature EXIF
+    ne sont pas supportés (l'EOI de la miniature couperait l'image).
+    """
+    for start, end in _mjpeg_bounds(data):
+        yield data[start:end]
+
+
+def _zip_frame_infos(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Entrées images d'une archive, triées par nom."""
+    return sorted(
+        (info for info in archive.infolist()
+         if not info.is_dir() and Path(info.filename).suffix.lower() in FRAME_EXTENSIONS),
+        key=lambda info: info.filename,
+    )
+
+
+def scan_sequence(data: bytes, filename: str, max_frames: int, max_frame_size: int,
+                  max_total_size: int) -> int:
+    """
+    Vérifie les limites d'une séquence sans décompresser ses images
+    (tailles déclarées dans le répertoire central du ZIP ; zipfile
+    n'extrait jamais plus que la taille déclarée d'une entrée).
+
+    Args:
+        data: Archive ZIP ou flux MJPEG
+        filename: Nom du fichier (détermine le format)
+        max_frames: Nombre maximum d'images
+        max_frame_size: Taille maximale d'une image décompressée (octets)
+        max_total_size: Taille décompressée totale maximale (octets)
+
+    Returns:
+        Nombre d'images de la séquence
+
+    Raises:
+        SequenceLimitExceeded: Une limite est dépassée
+        ValueError: Format de séquence non supporté
+    """
+    extension = Path(filename).suffix.lower()
+    if extension == ".zip":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            sizes = [info.file_size for info in _zip_frame_infos(archive)]
+    elif extension in (".mjpeg", ".mjpg"):
+        sizes = []
+        for start, end in _mjpeg_bounds(data):
+            sizes.append(end - start)
+            if len(sizes) > max_frames:
+                break
+    else:
+        raise ValueError(f"Format de séquence non supporté : {extension}")
+
+    if len(sizes) > max_frames:
+        raise SequenceLimitExceeded(f"Trop d'images. Maximum : {max_frames} par séquence")
+    if any(size > max_frame_size for size in sizes):
+        raise SequenceLimitExceeded(
+            f"Image trop volumineuse. Taille maximale : {max_frame_size // (1024*1024)} MB par image"
+        )
+    if sum(sizes) > max_total_size:
+        raise SequenceLimitExceeded(
+            f"Séquence trop volumineuse une fois décompressée. Maximum : {max_total_size // (1024*1024)} MB"
+        )
+    return len(sizes)
+
+
+def iter_sequence_frames(data: bytes, filename: str) -> Iterator[Tuple[str, bytes]]:
+    """
+    Images d'une séquence uploadée : archive ZIP (triée par nom) ou flux MJPEG.
+    Les images sont extraites une à une, à la demande.
+
+    Yields:
+        Tuples (nom de l'image, contenu encodé)
+
+    Raises:
+        ValueError: Format de séquence non supporté
+    """
+    extension = Path(filename).suffix.lower()
+    if extension == ".zip":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for info in _zip_frame_infos(archive):
+                yield Path(info.filename).name, archive.read(info)
+    elif extension in (".mjpeg", ".mjpg"):
+        for index, frame in enumerate(iter_mjpeg_frames(data)):
+            yield f"frame_{index:05d}.jpg", frame
+    else:
+        raise ValueError(f"Format de séquence non supporté : {extension}")
+
+
+def iter_directory_frames(directory: str) -> Iterator[Tuple[str, bytes]]:
+    """Images d'un dossier, triées par nom."""
+    for path in sorted(Path(directory).iterdir()):
+        if path.is_file() and path.suffix.lower() in FRAME_EXTENSIONS:
+            yield path.name, path.read_bytes()
+
+
+class SequenceRestorer:
+    """
+    Restaure les images d'une séquence en réutilisant les tuiles inchangées.
+
+    Une tuile est considérée inchangée si ses pixels sont identiques (hash
+    de bloc, ``threshold=0``) ou si leur écart maximal reste sous
+    ``threshold`` par rapport à l'entrée qui a servi à la restaurer la
+    dernière fois (la dérive ne peut donc pas s'accumuler).
+
+    Les tuiles modifiées sont restaurées avec une marge de contexte
+    (``context`` pixels) puis recadrées, et les recadrages de même taille
+    partagent un forward batché.
+
+    Args:
+        model: Modèle U-Net
+        device: Device PyTorch
+        quality: Qualité JPEG estimée (5-30)
+        tile_size: Taille des tuiles comparées (multiple de 16)
+        context: Marge de contexte autour d'une tuile restaurée
+        threshold: Écart maximal (0-255) pour qu'une tuile soit réutilisée
+        bit_exact: True : les tuiles inchangées sont recopiées à l'identique.
+            False : le delta précédent est appliqué à la nouvelle entrée
+            (suit les petites variations sous le seuil)
+        max_batch_size: Tuiles maximum par forward batché
+        bucket_policy: Politique de bucketing (les tuiles de bord rejoignent
+            alors les lots des tuiles pleines)
+    """
+
+    def __init__(self, model: torch.nn.Module, device: torch.device, quality: int = 5,
+                 tile_size: int = 128, context: int = 32, threshold: int = 0,
+                 bit_exact: bool = True, max_batch_size: int = 8,
+                 bucket_policy: Optional[BucketPolicy] = None):
+        if tile_size % 16 != 0:
+            raise ValueError("tile_size doit être un multiple de 16")
+        self.model = model
+        self.device = device
+        self.quality = quality
+        self.tile_size = tile_size
+        self.context = context
+        self.threshold = threshold
+        self.bit_exact = bit_exact
+        self.max_batch_size = max_batch_size
+        self.bucket_policy = bucket_policy
+        self.stats = {"frames": 0, "tiles_total": 0, "tiles_restored": 0}
+        self.reset()
+
+    def reset(self):
+        """Oublie l'image précédente : la prochaine sera restaurée entièrement."""
+        self._reference: Optional[np.ndarray] = None  # Entrée ayant servi à restaurer chaque tuile
+        self._delta: Optional[np.ndarray] = None  # Sortie - entrée (int16)
+        self._output: Optional[np.ndarray] = None
+        self._hashes: Dict[Box, bytes] = {}
+
+    def _boxes(self, height: int, width: int) -> List[Box]:
+        return [
+            (y, x, min(y + self.tile_size, height), min(x + self.tile_size, width))
+            for y in range(0, height, self.tile_size)
+            for x in range(0, width, self.tile_size)
+        ]
+
+    @staticmethod
+    def _hash(block: np.ndarray) -> bytes:
+        return hashlib.blake2b(np.ascontiguousarray(block).tobytes(), digest_size=16).digest()
+
+    def _is_unchanged(self, current: np.ndarray, box: Box) -> bool:
+        top, left, bottom, right = box
+        block = current[top:bottom, left:right]
+        if self.threshold == 0:
+            return self._hash(block) == self._hashes.get(box)
+        reference = self._reference[top:bottom, left:right]
+        return int(np.abs(block.astype(np.int16) - reference).max()) <= self.threshold
+
+    def _update_tile(self, current: np.ndarray, box: Box, restored: np.ndarray):
+        top, left, bottom, right = box
+        self._output[top:bottom, left:right] = restored
+        self._reference[top:bottom, left:right] = current[top:bottom, left:right]
+        self._delta[top:bottom, left:right] = restored.astype(np.int16) - current[top:bottom, left:right]
+        if self.threshold == 0:
+            self._hashes[box] = self._hash(current[top:bottom, left:right])
+
+    def _restore_tiles(self, frame: Image.Image, current: np.ndarray, boxes: List[Box], timer=None):
+        height, width = current.shape[:2]
+        crops: Dict[Tuple[int, int], List[Tuple[Box, Box, Image.Image]]] = {}
+        for box in boxes:
+            top, left, bottom, right = box
+            crop_box = (max(0, top - self.context), max(0, left - self.context),
+                        min(height, bottom + self.context), min(width, right + self.context))
+            crop = frame.crop((crop_box[1], crop_box[0], crop_box[3], crop_box[2]))
+            key = padded_size(crop.width, crop.height, bucket_policy=self.bucket_policy)
+            crops.setdefault(key, []).append((box, crop_box, crop))
+
+        for group in crops.values():
+            for start in range(0, len(group), self.max_batch_size):
+                chunk = group[start:start + self.max_batch_size]
+                outputs = infer_batch(self.model, [crop for _, _, crop in chunk], self.device,
+                                      quality=self.quality, timer=timer, bucket_policy=self.bucket_policy)
+                for (box, crop_box, _), output in zip(chunk, outputs):
+                    top, left, bottom, right = box
+                    restored = np.asarray(output)[top - crop_box[0]:bottom - crop_box[0],
+                                                  left - crop_box[1]:right - crop_box[1]]
+                    self._update_tile(current, box, restored)
+
+    def restore_frame(self, frame: Image.Image, timer=None) -> Image.Image:
+        """
+        Restaure l'image suivante de la séquence.
+
+        La première image (ou une image de taille différente) est restaurée
+        entièrement ; les suivantes ne recalculent que les tuiles modifiées.
+        """
+        frame = correct_image_orientation(frame)
+        if frame.mode != 'RGB':
+            frame = frame.convert('RGB')
+        current = np.asarray(frame, dtype=np.uint8)
+        boxes = self._boxes(*current.shape[:2])
+
+        if self._output is None or self._output.shape != current.shape:
+            restored = np.asarray(restore_image(self.model, frame, self.device, quality=self.quality,
+                                                timer=timer, bucket_policy=self.bucket_policy))
+            self._output = restored.copy()
+            self._reference = current.copy()
+            self._delta = restored.astype(np.int16) - current
+            self._hashes = {}
+            if self.threshold == 0:
+                self._hashes = {
+                    box: self._hash(current[box[0]:box[2], box[1]:box[3]]) for box in boxes
+                }
+            changed = boxes
+        else:
+            changed = [box for box in boxes if not self._is_unchanged(current, box)]
+            if changed:
+                self._restore_tiles(frame, current, changed, timer)
+            if not self.bit_exact:
+                # Tuiles modifiées : current + delta == sortie restaurée
+                self._output = np.clip(current.astype(np.int16) + self._delta, 0, 255).astype(np.uint8)
+
+        self.stats["frames"] += 1
+        self.stats["tiles_total"] += len(boxes)
+        self.stats["tiles_restored"] += len(changed)
+        return Image.fromarray(self._output.copy(), mode='RGB')
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Fraction des tuiles réutilisées sans passer par le modèle."""
+        if self.stats["tiles_total"] == 0:
+            return 0.0
+        return 1.0 - self.stats["tiles_restored"] / self.stats["tiles_total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restauration d'une séquence d'images avec réutilisation des tuiles inchangées")
+    parser.add_argument("input", help="Dossier d'images, archive .zip ou flux .mjpeg/.mjpg")
+    parser.add_argument("output", help="Dossier de sortie, ou archive .zip")
+    parser.add_argument("--model", default="models/best_model.pth", help="Chemin du modèle")
+    parser.add_argument("--quality", type=int, default=5, help="Qualité JPEG estimée (5-30)")
+    parser.add_argument("--tile-size", type=int, default=128, help="Taille des tuiles comparées (multiple de 16)")
+    parser.add_argument("--context", type=int, default=32, help="Marge de contexte autour des tuiles restaurées")
+    parser.add_argument("--threshold", type=int, default=0, help="Écart maximal (0-255) pour réutiliser une tuile")
+    parser.add_argument("--no-bit-exact", action="store_true",
+                        help="Appliquer le delta précédent aux tuiles inchangées au lieu de les recopier")
+    args = parser.parse_args()
+
+    from model import load_model
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if not os.path.exists(args.model):
+        print(f"❌ Fichier modèle introuvable : {args.model}")
+        sys.exit(1)
+    model = load_model(args.model, device)
+
+    if os.path.isdir(args.input):
+        frames = iter_directory_frames(args.input)
+    else:
+        frames = iter_sequence_frames(Path(args.input).read_bytes(), args.input)
+
+    restorer = SequenceRestorer(
+        model, device,
+        quality=max(5, min(30, args.quality)),
+        tile_size=args.tile_size,
+        context=args.context,
+        threshold=args.threshold,
+        bit_exact=not args.no_bit_exact,
+    )
+
+    archive = None
+    if args.output.lower().endswith(".zip"):
+        archive = zipfile.ZipFile(args.output, mode="w", compression=zipfile.ZIP_STORED)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    try:
+        for index, (name, data) in enumerate(frames):
+            frame_start = time.perf_counter()
+            restored = restorer.restore_frame(Image.open(io.BytesIO(data)))
+            output_name = f"{index:05d}_restored_{Path(name).stem}.png"
+            if archive is not None:
+                buffer = io.BytesIO()
+                restored.save(buffer, format="PNG")
+                archive.writestr(output_name, buffer.getvalue())
+            else:
+                restored.save(os.path.join(args.output, output_name), format="PNG")
+            print(f"🎞️  {name} -> {output_name} ({(time.perf_counter() - frame_start) * 1000:.0f} ms)")
+    finally:
+        if archive is not None:
+            archive.close()
+
+    print(f"✅ {restorer.stats['frames']} images restaurées en {time.perf_counter() - start:.1f}s")
+    print(f"♻️  Tuiles réutilisées : {restorer.reuse_ratio:.1%} "
+          f"({restorer.stats['tiles_restored']}/{restorer.stats['tiles_total']} recalculées)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Tests du contrôleur d'admission (voies, priorité, rejets 413/503).
+"""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, FAST_LANE, THROUGHPUT_LANE
+
+
+def _controller(**kwargs):
+    options = dict(pixel_budget=1000, small_image_pixels=100, fast_slots=1,
+                   throughput_slots=1, fast_reserved_pixels=200, deadline_seconds=1.0)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+async def _hold(controller, pixels, seconds, events=None, name=None):
+    """Occupe un créneau pendant ``seconds`` et note l'ordre de démarrage."""
+    async with controller.admit(pixels) as lane:
+        if events is not None:
+            events.append(name)
+        await asyncio.sleep(seconds)
+        return lane
+
+
+def test_idle_lane_admits_after_slow_request():
+    async def scenario():
+        controller = _controller(deadline_seconds=0.05)
+        # Requête plus longue que l'échéance : la moyenne glissante la retient
+        await _hold(controller, 100, 0.1)
+        # La voie est vide : l'attente estimée est nulle, la requête passe
+        for _ in range(3):
+            assert await _hold(controller, 100, 0.0) == FAST_LANE
+
+    asyncio.run(scenario())
+
+
+def test_fast_lane_has_priority_over_throughput_lane():
+    async def scenario():
+        controller = _controller()
+        events = []
+        first = asyncio.create_task(_hold(controller, 50, 0.05, events, "fast-1"))
+        await asyncio.sleep(0.01)
+        waiting_fast = asyncio.create_task(_hold(controller, 50, 0.0, events, "fast-2"))
+        await asyncio.sleep(0.01)
+        # La voie débit est libre, mais une petite image attend déjà
+        large = asyncio.create_task(_hold(controller, 500, 0.0, events, "throughput"))
+        await asyncio.sleep(0.01)
+        assert events == ["fast-1"]
+        lanes = await asyncio.gather(first, waiting_fast, large)
+        assert events == ["fast-1", "fast-2", "throughput"]
+        assert lanes == [FAST_LANE, FAST_LANE, THROUGHPUT_LANE]
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_sheds_with_retry_after():
+    async def scenario():
+        controller = _controller(deadline_seconds=0.05)
+        holder = asyncio.create_task(_hold(controller, 50, 0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as info:
+            await _hold(controller, 50, 0.0)
+        assert info.value.status_code == 503
+        assert info.value.retry_after >= 1
+        await holder
+        # Le créneau libéré, la voie admet de nouveau
+        assert await _hold(controller, 50, 0.0) == FAST_LANE
+
+    asyncio.run(scenario())
+
+
+def test_estimated_wait_sheds_immediately():
+    async def scenario():
+        controller = _controller(deadline_seconds=0.05)
+        await _hold(controller, 100, 0.04)  # ~0.4 ms/pixel
+        holder = asyncio.create_task(_hold(controller, 100, 0.2))
+        queued = asyncio.create_task(_hold(controller, 100, 0.0))
+        await asyncio.sleep(0.01)
+        # 200 pixels devant nous : ~0.08 s estimées > échéance de 0.05 s
+        with pytest.raises(AdmissionRejected) as info:
+            await _hold(controller, 100, 0.0)
+        assert info.value.status_code == 503
+        assert "estimée" in info.value.detail
+        holder.cancel()
+        await asyncio.gather(holder, queued, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_too_large_image_is_rejected_with_413():
+    async def scenario():
+        controller = _controller()
+        # La voie débit n'a pas accès à la part réservée : 1000 - 200 pixels
+        with pytest.raises(AdmissionRejected) as info:
+            await _hold(controller, 801, 0.0)
+        assert info.value.status_code == 413
+        assert info.value.retry_after is None
+        assert await _hold(controller, 800, 0.0) == THROUGHPUT_LANE
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+"""
+Tests de non-régression du format delta (partagé avec frontend/src/utils/deltaDecoder.js).
+"""
+
+import numpy as np
+import pytest
+
+from delta_codec import HEADER, encode_delta, decode_delta, apply_delta
+
+
+def _pair(height=150, width=203, amplitude=20, seed=0):
+    """Image d'origine et version « restaurée » proche (delta borné)."""
+    rng = np.random.default_rng(seed)
+    original = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    noise = rng.integers(-amplitude, amplitude + 1, original.shape)
+    restored = np.clip(original.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return original, restored
+
+
+def test_roundtrip_is_exact_with_step_1():
+    original, restored = _pair()
+    payload, stats = encode_delta(original, restored, step=1)
+    np.testing.assert_array_equal(apply_delta(original, payload), restored)
+    assert stats["bytes"] == len(payload)
+
+
+@pytest.mark.parametrize("step", [2, 4, 7])
+def test_quantization_error_is_bounded_by_half_step(step):
+    original, restored = _pair(amplitude=60)
+    payload, _ = encode_delta(original, restored, step=step)
+    error = np.abs(apply_delta(original, payload).astype(np.int16) - restored.astype(np.int16))
+    assert error.max() <= step / 2
+
+
+def test_zero_tiles_are_omitted():
+    original, restored = _pair(height=128, width=192)
+    # Grille 2 x 3 de tuiles de 64 : seules deux tuiles changent
+    restored = original.copy()
+    restored[10, 10] += 1
+    restored[100, 150] ^= 0x0F
+    payload, stats = encode_delta(original, restored, tile_size=64)
+    assert stats == {"tiles": 2, "tiles_total": 6, "bytes": len(payload)}
+    np.testing.assert_array_equal(apply_delta(original, payload), restored)
+
+    payload, stats = encode_delta(original, original)
+    assert stats["tiles"] == 0
+    assert not decode_delta(payload).any()
+
+
+def test_partial_edge_tile():
+    # 150 x 203 : tuiles de bord de 22 x 11 pixels avec des tuiles de 64
+    original, _ = _pair()
+    restored = original.copy()
+    corner = restored[140:, 195:].astype(np.int16)
+    restored[140:, 195:] = np.where(corner >= 100, corner - 100, corner + 100).astype(np.uint8)
+    payload, stats = encode_delta(original, restored, tile_size=64)
+    assert stats["tiles"] == 1
+    assert stats["tiles_total"] == 3 * 4
+    np.testing.assert_array_equal(apply_delta(original, payload), restored)
+
+
+def test_invalid_magic_raises():
+    original, restored = _pair()
+    payload, _ = encode_delta(original, restored)
+    with pytest.raises(ValueError):
+        decode_delta(b"XXXX" + payload[4:])
+
+
+def test_truncated_payload_raises():
+    original, restored = _pair()
+    payload, _ = encode_delta(original, restored)
+    with pytest.raises(ValueError):
+        decode_delta(payload[:HEADER.size - 1])
+    with pytest.raises(ValueError):
+        decode_delta(payload[:HEADER.size + 10])
@@ -3,11 +3,14 @@ import ImageUploader from './components/ImageUploader';
 import ImageComparison from './components/ImageComparison';
 import LoadingSpinner from './components/LoadingSpinner';
 import axios from 'axios';
+import { reconstructImage } from './utils/deltaDecoder';
 
 // Configuration de l'API URL
 // En développement local ou depuis le navigateur, utiliser localhost
 // En production Docker, la variable d'environnement peut être définie
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+// Recevoir seulement le delta résiduel (réponse plus légère) et reconstruire l'image localement
+const USE_DELTA_RESPONSE = import.meta.env.VITE_DELTA_RESPONSE === 'true';
 
 function App() {
   const [originalImage, setOriginalImage] = useState(null);
@@ -36,7 +39,8 @@ function App() {
       formData.append('file', originalImage.file);
 
       // Envoyer la requête au backend
-      const response = await axios.post(`${API_URL}/restore`, formData, {
+      const endpoint = USE_DELTA_RESPONSE ? `${API_URL}/restore?response_format=delta` : `${API_URL}/restore`;
+      const response = await axios.post(endpoint, formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
@@ -44,17 +48,25 @@ function App() {
       });
 
       // Créer une URL pour l'image restaurée
-      const restoredUrl = URL.createObjectURL(response.data);
+      const restoredBlob = USE_DELTA_RESPONSE
+        ? await reconstructImage(originalImage.file, response.data)
+        : response.data;
+      const restoredUrl = URL.createObjectURL(restoredBlob);
       setRestoredImage(restoredUrl);
     } catch (err) {
       console.error('Error enhancing image:', err);
       
       if (err.response) {
         // Le serveur a répondu avec un code d'erreur
-        if (err.response.status === 503) {
+        if (err.response.status === 503 && err.response.headers['retry-after']) {
+          // Requête rejetée par le contrôle d'admission (serveur saturé)
+          setError(`The server is busy. Please retry in ${err.response.headers['retry-after']} seconds.`);
+        } else if (err.response.status === 503) {
           setError('The AI model is not loaded. Please check the server logs.');
         } else if (err.response.status === 413) {
-          setError('Image file is too large. Maximum size is 15 MB.');
+          // 15 MB par fichier ; les grandes images (voie débit) sont limitées à
+          // PIXEL_BUDGET - FAST_LANE_RESERVED_PIXELS = 40 MP
+          setError('Image is too large. Maximum size is 15 MB and 40 megapixels.');
         } else if (err.response.status === 415) {
           setError('Unsupported file format. Please use JPEG or PNG.');
         } else {
@@ -0,0 +1,92 @@
+// Décodeur du format delta (réponse /restore?response_format=delta).
+// Format décrit dans backend/delta_codec.py (décodeur de référence Python).
+//
+// Le serveur renvoie uniquement restauré - original, quantifié en int8 et
+// découpé en tuiles (tuiles nulles omises), compressé en deflate (zlib).
+// On réapplique ce delta sur l'image que l'utilisateur a envoyée.
+
+const MAGIC = 'UBD1';
+const HEADER_SIZE = 21;
+
+// Décompresse un flux zlib avec l'API native du navigateur
+async function inflate(bytes) {
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+export function parseDeltaHeader(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (buffer.byteLength < HEADER_SIZE || magic !== MAGIC || view.getUint8(4) !== 1) {
+    throw new Error('Invalid delta payload');
+  }
+  return {
+    channels: view.getUint8(5),
+    step: view.getUint8(6),
+    tileSize: view.getUint16(7, true),
+    width: view.getUint32(9, true),
+    height: view.getUint32(13, true),
+    tiles: view.getUint32(17, true),
+  };
+}
+
+// Applique le delta sur des pixels RGBA (ImageData.data) en place
+export async function applyDelta(pixels, buffer) {
+  const header = parseDeltaHeader(buffer);
+  const body = await inflate(new Uint8Array(buffer, HEADER_SIZE));
+  const bodyView = new DataView(body.buffer, body.byteOffset, body.byteLength);
+  const { step, tileSize, width, height } = header;
+  const cols = Math.ceil(width / tileSize);
+
+  let offset = 0;
+  for (let t = 0; t < header.tiles; t++) {
+    const index = bodyView.getUint32(offset, true);
+    offset += 4;
+    const top = Math.floor(index / cols) * tileSize;
+    const left = (index % cols) * tileSize;
+    const tileH = Math.min(tileSize, height - top);
+    const tileW = Math.min(tileSize, width - left);
+    for (let y = 0; y < tileH; y++) {
+      let p = ((top + y) * width + left) * 4;
+      for (let x = 0; x < tileW; x++, p += 4) {
+        for (let c = 0; c < 3; c++) {
+          const value = pixels[p + c] + bodyView.getInt8(offset++) * step;
+          pixels[p + c] = value < 0 ? 0 : value > 255 ? 255 : value;
+        }
+      }
+    }
+  }
+  return header;
+}
+
+// Reconstruit l'image restaurée (Blob PNG) à partir du fichier original et du delta.
+// Suppose une image opaque : le serveur ignore le canal alpha.
+export async function reconstructImage(originalFile, deltaBlob) {
+  const buffer = await deltaBlob.arrayBuffer();
+  const { width, height } = parseDeltaHeader(buffer);
+
+  // Orientation EXIF appliquée comme côté serveur (exif_transpose)
+  const bitmap = await createImageBitmap(originalFile, {
+    imageOrientation: 'from-image',
+    colorSpaceConversion: 'none',
+    premultiplyAlpha: 'none',
+  });
+  if (bitmap.width !== width || bitmap.height !== height) {
+    throw new Error(`Delta size ${width}x${height} does not match image ${bitmap.width}x${bitmap.height}`);
+  }
+
+  const canvas = document.createElement('canvas');
+  canvas.width = width;
+  canvas.height = height;
+  const ctx = canvas.getContext('2d');
+  ctx.drawImage(bitmap, 0, 0);
+  bitmap.close();
+
+  const imageData = ctx.getImageData(0, 0, width, height);
+  await applyDelta(imageData.data, buffer);
+  ctx.putImageData(imageData, 0, 0);
+
+  return new Promise((resolve, reject) => {
+    canvas.toBlob((blob) => (blob ? resolve(blob) : reject(new Error('PNG encoding failed'))), 'image/png');
+  });
+}